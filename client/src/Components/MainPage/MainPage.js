@@ -1,10 +1,11 @@
-import React, { useContext, useState, useEffect } from "react";
+import React, { useContext, useState, useEffect, useRef } from "react";
 import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
 import { useNavigate } from "react-router-dom";
 import {
   faArrowAltCircleRight,
   faEllipsisV,
   faMagnifyingGlass,
+  faPaperclip,
   faUser,
   faUserGroup,
 } from "@fortawesome/free-solid-svg-icons";
@@ -16,6 +17,9 @@ import io from "socket.io-client";
 import axios from "axios";
 import { UserContext } from "../UserContext/UserContext";
 
+// One connection for the page, not one per render.
+const socket = io("");
+
 const MainPage = () => {
   const roomNames = {
     Group1: "Just Chatting",
@@ -41,7 +45,6 @@ const MainPage = () => {
   const { fontSize } = useContext(FontContext);
   const currentFontClasses =
     FontClasses[fontSize] || FontClasses["fontDefault"];
-  const socket = io("");
   const [message, setMessage] = useState([]);
   const [chat, setChat] = useState([]);
   const [selectedRoom, setSelectedRoom] = useState("Group1");
@@ -49,6 +52,11 @@ const MainPage = () => {
   const [searchTerm, setSearchTerm] = useState([]);
   console.log("searchTerm: ", searchTerm);
   const [searchResults, setSearchResults] = useState([]);
+  const roomSeq = useRef(0);
+  const [unreadCounts, setUnreadCounts] = useState({});
+  const [typingUsers, setTypingUsers] = useState({});
+  const [attachmentFile, setAttachmentFile] = useState(null);
+  const [roomPreviews, setRoomPreviews] = useState({});
   console.log("searchResults: ", searchResults);
   console.log("whole_new_chat", chat);
   console.log("whole_new_chat", chat.data);
@@ -69,12 +77,41 @@ const MainPage = () => {
     localStorage.setItem("selectedRoom", selectedRoom);
   }, [selectedRoom]);
 
-  const handleRoomClick = (currentRoom) => {
-    setSelectedRoom(currentRoom);
-    setSelectedRoomName(roomNames[currentRoom]);
+  const joinSocketRoom = async (group_room_number) => {
+    // The server only subscribes members of the room to its updates.
+    try {
+      await axios.post(
+        `rooms/join`,
+        { group_room_number, name: roomNames[group_room_number] },
+        {
+          headers: {
+            Authorization: `Bearer ${userData.user_token}`,
+            "Content-Type": "application/json",
+          },
+        }
+      );
+    } catch (error) {
+      console.error("Error joining room:", error);
+    }
+    socket.emit("join_room", {
+      group_room_number,
+      user_token: userData.user_token,
+    });
+  };
+
+  const handleRoomClick = async (currentRoom) => {
+    const previousRoom = localStorage.getItem("group_room_number");
+    if (previousRoom === currentRoom) return;
+    if (previousRoom) {
+      socket.emit("leave_room", { group_room_number: previousRoom });
+    }
     localStorage.setItem("group_room_number", currentRoom);
     localStorage.setItem("group_room_name", roomNames[currentRoom]);
     console.log("group_room_number click", currentRoom);
+    // Subscribe before the room is loaded so no change falls in between.
+    await joinSocketRoom(currentRoom);
+    setSelectedRoom(currentRoom);
+    setSelectedRoomName(roomNames[currentRoom]);
   };
 
   axios.interceptors.request.use(function (config) {
@@ -95,6 +132,66 @@ const MainPage = () => {
     return config;
   });
 
+  const markRoomRead = async (group_room_number, messageId) => {
+    if (!group_room_number || !messageId) return;
+    try {
+      await axios.post(
+        `read_state/mark_read`,
+        { group_room_number, message_id: messageId },
+        {
+          headers: {
+            Authorization: `Bearer ${userData.user_token}`,
+            "Content-Type": "application/json",
+          },
+        }
+      );
+    } catch (error) {
+      console.error("Error marking room as read:", error);
+    }
+  };
+
+  const fetchUnreadCounts = async () => {
+    try {
+      const response = await axios.get(`read_state/unread`, {
+        headers: {
+          Authorization: `Bearer ${userData.user_token}`,
+        },
+      });
+      setUnreadCounts(response.data);
+    } catch (error) {
+      console.error("Error fetching unread counts:", error);
+    }
+  };
+
+  const fetchRoomPreviews = async () => {
+    try {
+      const response = await axios.get(`rooms`, {
+        headers: {
+          Authorization: `Bearer ${userData.user_token}`,
+        },
+      });
+      const previews = {};
+      response.data.forEach((room) => {
+        previews[room.group_room_number] = room.last_message;
+      });
+      setRoomPreviews(previews);
+    } catch (error) {
+      console.error("Error fetching rooms:", error);
+    }
+  };
+
+  const roomPreview = (room) => {
+    const lastMessage = roomPreviews[room];
+    if (!lastMessage) return null;
+    return <p className="room_preview_text">{lastMessage.text}</p>;
+  };
+
+  const unreadBadge = (room) => {
+    const count = unreadCounts[room] ? unreadCounts[room].unread_count : 0;
+    if (!count || room === selectedRoom) return null;
+    return <span className="unread_badge">{count}</span>;
+  };
+
   useEffect(() => {
     const fetchMessages = async () => {
       try {
@@ -109,6 +206,15 @@ const MainPage = () => {
           },
         });
         setChat(response.data);
+        roomSeq.current = Number(response.headers["x-room-seq"]) || 0;
+        if (response.data.length > 0) {
+          await markRoomRead(
+            group_room_number,
+            response.data[response.data.length - 1].id
+          );
+        }
+        fetchUnreadCounts();
+        fetchRoomPreviews();
         console.log("group room number: msg/all ", selectedRoom);
         console.log("response", response.data);
       } catch (error) {
@@ -119,22 +225,168 @@ const MainPage = () => {
     fetchMessages();
   }, [selectedRoom, userData.user_token]);
 
+  const applyMessageChange = (change) => {
+    if (change.group_room_number !== localStorage.getItem("group_room_number")) {
+      return;
+    }
+    setChat((prevChat) => {
+      if (change.op === "delete") {
+        return prevChat.filter((chatMessage) => chatMessage.id !== change.id);
+      }
+      const updatedMessage = {
+        ...change,
+        is_current_user: change.user_id === userData.user_id,
+      };
+      const index = prevChat.findIndex(
+        (chatMessage) => chatMessage.id === change.id
+      );
+      if (index === -1) {
+        return [...prevChat, updatedMessage];
+      }
+      if (prevChat[index].seq >= change.seq) {
+        return prevChat;
+      }
+      const nextChat = [...prevChat];
+      nextChat[index] = updatedMessage;
+      return nextChat;
+    });
+    roomSeq.current = Math.max(roomSeq.current, change.seq);
+    if (change.op === "create") {
+      markRoomRead(change.group_room_number, change.id);
+    }
+  };
+
+  const syncMessageChanges = async () => {
+    try {
+      const group_room_number = localStorage.getItem("group_room_number");
+      const response = await axios.get(`messages/changes`, {
+        headers: {
+          Authorization: `Bearer ${userData.user_token}`,
+        },
+        params: {
+          group_room_number,
+          since: roomSeq.current,
+        },
+      });
+      if (response.data.reset) {
+        const allResponse = await axios.get(`messages/all`, {
+          headers: {
+            Authorization: `Bearer ${userData.user_token}`,
+          },
+          params: {
+            group_room_number,
+          },
+        });
+        setChat(allResponse.data);
+        roomSeq.current = Number(allResponse.headers["x-room-seq"]) || 0;
+        return;
+      }
+      response.data.changes.forEach(applyMessageChange);
+      roomSeq.current = Math.max(roomSeq.current, response.data.seq);
+    } catch (error) {
+      console.error("Error syncing message changes:", error);
+    }
+  };
+
+  const handleEditMessage = async (chatMessage) => {
+    const text = window.prompt("Edit message", chatMessage.text);
+    if (!text || text === chatMessage.text) return;
+
+    try {
+      const response = await axios.post(
+        `messages/edit`,
+        { message_id: chatMessage.id, text },
+        {
+          headers: {
+            Authorization: `Bearer ${userData.user_token}`,
+            "Content-Type": "application/json",
+          },
+        }
+      );
+      applyMessageChange(response.data);
+    } catch (error) {
+      console.error("Error editing message:", error);
+    }
+  };
+
+  const handleDeleteMessage = async (chatMessage) => {
+    try {
+      const response = await axios.post(
+        `messages/delete`,
+        { message_id: chatMessage.id },
+        {
+          headers: {
+            Authorization: `Bearer ${userData.user_token}`,
+            "Content-Type": "application/json",
+          },
+        }
+      );
+      applyMessageChange(response.data);
+    } catch (error) {
+      console.error("Error deleting message:", error);
+    }
+  };
+
+  const uploadAttachment = async (file) => {
+    // The file is sent as the raw request body so the server can stream it.
+    const response = await axios.post(`attachments`, file, {
+      headers: {
+        Authorization: `Bearer ${userData.user_token}`,
+        "Content-Type": file.type || "application/octet-stream",
+        "X-Filename": encodeURIComponent(file.name),
+      },
+    });
+    return response.data.id;
+  };
+
+  const attachmentUrl = (attachment, thumbnail) =>
+    `attachments/${attachment.id}${thumbnail ? "/thumbnail" : ""}?user_token=${
+      userData.user_token
+    }`;
+
+  const renderAttachment = (attachment) => {
+    if (attachment.content_type.startsWith("image/")) {
+      return (
+        <a href={attachmentUrl(attachment, false)} target="_blank" rel="noreferrer">
+          <img
+            className="attachment_image"
+            src={attachmentUrl(attachment, true)}
+            alt={attachment.filename}
+            onError={(e) => {
+              e.target.src = attachmentUrl(attachment, false);
+            }}
+          />
+        </a>
+      );
+    }
+    return (
+      <a className="attachment_link" href={attachmentUrl(attachment, false)}>
+        {attachment.filename || "attachment"}
+      </a>
+    );
+  };
+
   const handleText = async (e) => {
     e.preventDefault();
 
-    if (message) {
+    if (message || attachmentFile) {
       console.log("Message:", message);
       socket.emit("chat message", message);
 
       try {
         const userToken = userData.user_token;
         const selectedRoom = localStorage.getItem("group_room_number");
+        const attachmentId = attachmentFile
+          ? await uploadAttachment(attachmentFile)
+          : null;
+        setAttachmentFile(null);
         const sendResponse = await axios.post(
           `messages/send`,
           {
             text: message,
             user_token: userToken,
             group_room_number: selectedRoom,
+            attachment_id: attachmentId,
           },
           {
             headers: {
@@ -155,7 +407,11 @@ const MainPage = () => {
           });
           const newMessage = response.data;
           console.log("Response messsages", response);
-          setChat((prevChat) => [...prevChat, newMessage]);
+          setChat((prevChat) =>
+            prevChat.some((chatMessage) => chatMessage.id === newMessage.id)
+              ? prevChat
+              : [...prevChat, newMessage]
+          );
           console.log("newMessage:", newMessage);
         } else {
           console.error("Error sending message:", sendResponse.status);
@@ -163,7 +419,7 @@ const MainPage = () => {
       } catch (error) {
         console.error("Error sending message to the backend:", error);
       }
-      setMessage("");
+      handleTyping("");
     }
   };
 
@@ -221,26 +477,84 @@ const MainPage = () => {
     };
   });
 
-  socket.on("connect_error", (error) => {
-    console.error("Socket connection error:", error);
-    setTimeout(() => {
-      socket.connect();
-    }, 5000);
-  });
+  useEffect(() => {
+    const handleConnect = async () => {
+      console.log("Connected to Socket.io server");
+      socket.emit("frontend_to_backend", "Hello from the frontend");
+      // Rejoin after every (re)connect and catch up on what was missed.
+      await joinSocketRoom(localStorage.getItem("group_room_number"));
+      syncMessageChanges();
+    };
+    const handleDisconnect = () => {
+      console.log("Disconnected from Socket.io server");
+    };
+    const handleConnectError = (error) => {
+      console.error("Socket.io connection error:", error);
+    };
 
-  socket.on("connect", () => {
-    console.log("Connected to Socket.io server");
-  });
+    socket.on("connect", handleConnect);
+    socket.on("disconnect", handleDisconnect);
+    socket.on("connect_error", handleConnectError);
+    if (socket.connected) {
+      handleConnect();
+    }
+
+    return () => {
+      socket.off("connect", handleConnect);
+      socket.off("disconnect", handleDisconnect);
+      socket.off("connect_error", handleConnectError);
+    };
+  }, [userData.user_token]);
+
+  const handleTyping = (text) => {
+    setMessage(text);
+    socket.emit("ephemeral", {
+      type: "typing",
+      group_room_number: localStorage.getItem("group_room_number"),
+      payload: { typing: text.length > 0 },
+    });
+  };
 
-  socket.on("disconnect", () => {
-    console.log("Disconnected from Socket.io server");
+  useEffect(() => {
+    socket.on("ephemeral_batch", (batch) => {
+      if (batch.group_room_number !== localStorage.getItem("group_room_number")) {
+        return;
+      }
+      setTypingUsers((prevTypingUsers) => {
+        const nextTypingUsers = { ...prevTypingUsers };
+        batch.events.forEach((event) => {
+          if (event.type !== "typing" || event.user_id === userData.user_id) {
+            return;
+          }
+          if (event.payload && event.payload.typing) {
+            nextTypingUsers[event.user_id] = true;
+          } else {
+            delete nextTypingUsers[event.user_id];
+          }
+        });
+        return nextTypingUsers;
+      });
+    });
+
+    return () => {
+      socket.off("ephemeral_batch");
+    };
   });
 
-  socket.on("connect_error", (error) => {
-    console.error("Socket.io connection error:", error);
+  const typingNames = Object.keys(typingUsers).map((typingUserId) => {
+    const typingMessage = chat.find(
+      (chatMessage) => String(chatMessage.user_id) === typingUserId
+    );
+    return typingMessage ? typingMessage.username : "Someone";
   });
 
-  socket.emit("frontend_to_backend", "Hello from the frontend");
+  useEffect(() => {
+    socket.on("message_changed", applyMessageChange);
+
+    return () => {
+      socket.off("message_changed");
+    };
+  });
 
   useEffect(() => {
     console.log("useEffect socket on");
@@ -293,6 +607,8 @@ const MainPage = () => {
           >
             <FontAwesomeIcon icon={faUserGroup} className="chat_list_icons" />
             <p className="profile_box_text">Just Chatting</p>
+            {roomPreview("Group1")}
+            {unreadBadge("Group1")}
           </button>
         </div>
         <div className="chat_list_box">
@@ -302,6 +618,8 @@ const MainPage = () => {
           >
             <FontAwesomeIcon icon={faUserGroup} className="chat_list_icons" />
             <p className="profile_box_text">Video Games</p>
+            {roomPreview("Group2")}
+            {unreadBadge("Group2")}
           </button>
         </div>
         <div className="chat_list_box">
@@ -311,6 +629,8 @@ const MainPage = () => {
           >
             <FontAwesomeIcon icon={faUserGroup} className="chat_list_icons" />
             <p className="profile_box_text">Literature</p>
+            {roomPreview("Group3")}
+            {unreadBadge("Group3")}
           </button>
         </div>
         <div className="chat_list_box">
@@ -339,7 +659,7 @@ const MainPage = () => {
                     className={`message-container ${
                       message.is_current_user ? "" : "other-user"
                     }`}
-                    key={index}
+                    key={message.id || index}
                   >
                     <div
                       className={`message-box ${
@@ -362,6 +682,27 @@ const MainPage = () => {
                           ? highlightText(message.text, searchTerm)
                           : message.text}
                       </p>
+                      {message.attachment &&
+                        renderAttachment(message.attachment)}
+                      {message.edited_at && (
+                        <p className="edited_label">(edited)</p>
+                      )}
+                      {message.is_current_user && (
+                        <div className="message_actions">
+                          <button
+                            className="message_action_button"
+                            onClick={() => handleEditMessage(message)}
+                          >
+                            Edit
+                          </button>
+                          <button
+                            className="message_action_button"
+                            onClick={() => handleDeleteMessage(message)}
+                          >
+                            Delete
+                          </button>
+                        </div>
+                      )}
                     </div>
                   </div>
                 ))}
@@ -369,16 +710,33 @@ const MainPage = () => {
             )}
           </div>
         </div>
+        {typingNames.length > 0 && (
+          <p className="typing_indicator">
+            {typingNames.join(", ")}{" "}
+            {typingNames.length === 1 ? "is" : "are"} typing...
+          </p>
+        )}
         <form
           onSubmit={handleText}
           enctype="application/json"
           className="text_box"
         >
+          <label className="attachment_button">
+            <FontAwesomeIcon icon={faPaperclip} />
+            <input
+              type="file"
+              hidden
+              onChange={(e) => setAttachmentFile(e.target.files[0] || null)}
+            />
+          </label>
+          {attachmentFile && (
+            <span className="attachment_name">{attachmentFile.name}</span>
+          )}
           <input
             className="input_message_box"
             type="text"
             value={message}
-            onChange={(e) => setMessage(e.target.value)}
+            onChange={(e) => handleTyping(e.target.value)}
             placeholder="Type here..."
           />
           <button type="submit" className="input_message_button">
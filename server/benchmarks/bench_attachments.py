@@ -0,0 +1,156 @@
+"""Concurrent large uploads through the /attachments endpoint.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_attachments --uploads 4 --size-mb 300
+
+The app is served by werkzeug on a local port against the in-memory
+database, and each upload is a synthetic body streamed to POST /attachments
+over HTTP, so the numbers include request parsing and the database insert.
+Peak RSS of the process (server and clients) is reported against the
+baseline so the memory ceiling can be compared with the total bytes
+uploaded. The last upload repeats the first one's content to check
+deduplication.
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SyntheticUpload:
+    def __init__(self, seed, size, block):
+        self.remaining = size
+        self.prefix = seed.to_bytes(8, "big")
+        self.block = block
+        self.sent_prefix = False
+
+    def read(self, n=-1):
+        if self.remaining <= 0:
+            return b""
+        if not self.sent_prefix:
+            self.sent_prefix = True
+            chunk = self.prefix
+        else:
+            if n is None or n < 0:
+                n = len(self.block)
+            chunk = self.block[: min(n, self.remaining, len(self.block))]
+        self.remaining -= len(chunk)
+        return chunk
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def start_server(root):
+    os.environ["DATABASE_PROFILE"] = "memory"
+    os.environ["BACKGROUND_TASKS"] = "0"
+    os.environ["ATTACHMENT_STORAGE_PATH"] = root
+
+    from werkzeug.serving import make_server
+
+    from routes import main
+
+    with main.app.app_context():
+        main.db.create_all()
+    client = main.app.test_client()
+    client.post(
+        "/register",
+        json={
+            "name": "bench",
+            "email": "bench@gmail.com",
+            "username": "bench",
+            "password": "Passw0rd!!x",
+            "birthdate": None,
+        },
+    )
+    token = client.post(
+        "/login", json={"username": "bench", "password": "Passw0rd!!x"}
+    ).json["user_token"]
+
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, token
+
+
+def upload(port, token, body, size):
+    connection = http.client.HTTPConnection("127.0.0.1", port, blocksize=64 * 1024)
+    try:
+        connection.request(
+            "POST",
+            "/attachments",
+            body=body,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(size),
+                "X-Filename": "bench.bin",
+            },
+        )
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=300)
+    parser.add_argument("--dir", default=None, help="store root (default: temp)")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="bench_attachments_")
+    size = args.size_mb * 1024 * 1024
+    block = os.urandom(1024 * 1024)
+    seeds = list(range(args.uploads)) + [0]
+
+    server, token = start_server(root)
+    port = server.server_port
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(seeds)) as pool:
+            results = list(
+                pool.map(
+                    lambda seed: upload(
+                        port, token, SyntheticUpload(seed, size, block), size
+                    ),
+                    seeds,
+                )
+            )
+        elapsed = time.perf_counter() - start
+        total_mb = args.size_mb * len(seeds)
+        failed = [status for status, _ in results if status != 201]
+        blobs = [
+            name
+            for _, _, names in os.walk(root)
+            for name in names
+            if not name.endswith(".jpg")
+        ]
+
+        print(f"{len(seeds)} concurrent uploads of {args.size_mb} MB ({total_mb} MB)")
+        print(f"throughput: {total_mb / elapsed:.0f} MB/s in {elapsed:.1f}s")
+        print(
+            f"peak RSS: {peak_rss_mb():.0f} MB "
+            f"(+{peak_rss_mb() - baseline:.0f} MB over baseline)"
+        )
+        print(
+            f"blobs stored: {len(blobs)} for {len(seeds)} uploads "
+            f"(failed: {len(failed)})"
+        )
+    finally:
+        server.shutdown()
+        if args.dir is None:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
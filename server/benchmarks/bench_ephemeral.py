@@ -0,0 +1,110 @@
+"""Typing-indicator fan-out in a 1,000-member room, naive vs batched.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_ephemeral
+
+The naive path emits every keystroke to every member. The batched path goes
+through EphemeralEventHub, which throttles per sender and emits one batch
+per room per tick. Fan-out is simulated the way python-socketio does it: the
+packet is encoded once per emit and then written to every member's socket.
+"""
+import argparse
+import json
+import time
+
+from routes.ephemeral import EphemeralEventHub
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FanOut:
+    def __init__(self, members):
+        self.sockets = [[] for _ in range(members)]
+        self.emits = 0
+        self.writes = 0
+
+    def emit(self, event, data, to=None):
+        packet = json.dumps([event, data], default=str)
+        for socket in self.sockets:
+            socket.append(packet)
+        self.emits += 1
+        self.writes += len(self.sockets)
+        if len(self.sockets[0]) > 1000:
+            for socket in self.sockets:
+                socket.clear()
+
+
+def keystrokes(typists, keystrokes_per_second, seconds, tick):
+    steps = int(seconds / tick)
+    per_tick = max(1, int(keystrokes_per_second * tick))
+    for step in range(steps):
+        now = step * tick
+        events = [
+            (sender_id, {"typing": True}, now + i * tick / per_tick)
+            for i in range(per_tick)
+            for sender_id in range(typists)
+        ]
+        yield now, events
+
+
+def run_naive(args):
+    fan_out = FanOut(args.members)
+    published = 0
+    start = time.process_time()
+    for _, events in keystrokes(args.typists, args.rate, args.seconds, args.tick):
+        for sender_id, payload, _ in events:
+            fan_out.emit(
+                "ephemeral",
+                {"type": "typing", "user_id": sender_id, "payload": payload},
+                to="room",
+            )
+            published += 1
+    return published, fan_out, time.process_time() - start
+
+
+def run_batched(args):
+    fan_out = FanOut(args.members)
+    clock = FakeClock()
+    hub = EphemeralEventHub(fan_out.emit, clock=clock)
+    start = time.process_time()
+    for now, events in keystrokes(args.typists, args.rate, args.seconds, args.tick):
+        for sender_id, payload, at in events:
+            clock.now = at
+            hub.publish("room", sender_id, "typing", payload)
+        clock.now = now + args.tick
+        hub.flush()
+    return hub.published, fan_out, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--typists", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=8, help="keystrokes/s each")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tick", type=float, default=0.25)
+    args = parser.parse_args()
+
+    print(
+        f"{args.members} members, {args.typists} typing at {args.rate}/s "
+        f"for {args.seconds}s, tick {args.tick}s"
+    )
+    for name, run in (("naive", run_naive), ("batched", run_batched)):
+        published, fan_out, cpu = run(args)
+        print(
+            f"{name:>8}: {published / args.seconds:8.0f} events/s in, "
+            f"{fan_out.emits / args.seconds:7.1f} emits/s, "
+            f"{fan_out.writes / args.seconds:10.0f} socket writes/s, "
+            f"fan-out CPU {cpu / args.seconds * 1000:8.2f} ms per second"
+        )
+
+
+if __name__ == "__main__":
+    main()
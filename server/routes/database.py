@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+
+POSTGRES = "postgres"
+SQLITE = "sqlite"
+MEMORY = "memory"
+
+# Applied to every SQLite connection. WAL lets readers run while a message
+# is being written; NORMAL sync is safe with WAL and skips an fsync per
+# commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",
+    "cache_size": "-16000",
+    "temp_store": "MEMORY",
+    "mmap_size": str(256 * 1024 * 1024),
+}
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def database_profile():
+    """DATABASE_PROFILE, or postgres when only DATABASE_URL is set."""
+    profile = os.environ.get("DATABASE_PROFILE")
+    if profile:
+        return profile
+    database_url = os.environ.get("DATABASE_URL") or ""
+    if database_url.startswith("sqlite"):
+        return SQLITE
+    return POSTGRES if database_url else SQLITE
+
+
+def configure_database(app, profile=None):
+    """Set SQLALCHEMY_DATABASE_URI and engine options for a backend profile.
+
+    ``postgres`` uses DATABASE_URL. ``sqlite`` uses the file at SQLITE_PATH
+    (or a sqlite DATABASE_URL). ``memory`` is a private in-memory database
+    shared by every thread, which is what the tests use.
+    """
+    profile = profile or database_profile()
+    app.config["DATABASE_PROFILE"] = profile
+
+    if profile == POSTGRES:
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
+    elif profile == SQLITE:
+        database_url = os.environ.get("DATABASE_URL") or ""
+        if not database_url.startswith("sqlite"):
+            path = os.environ.get(
+                "SQLITE_PATH",
+                os.path.join(os.path.dirname(__file__), "..", "live_chat.db"),
+            )
+            database_url = "sqlite:///" + os.path.abspath(path)
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {"check_same_thread": False, "timeout": 5},
+        }
+    elif profile == MEMORY:
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {"check_same_thread": False},
+            "poolclass": StaticPool,
+        }
+    else:
+        raise ValueError(f"Unknown DATABASE_PROFILE: {profile}")
+
+    return profile
@@ -0,0 +1,170 @@
+import functools
+import logging
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+from sqlalchemy.pool import Pool
+
+
+class SessionManager:
+    """Keeps request transactions short.
+
+    Read-only routes are wrapped with ``read_only``: on PostgreSQL the
+    transaction is declared READ ONLY, and the session is always closed when
+    the view returns. Views call ``release`` once they have copied what they
+    need out of the ORM objects, so the connection is back in the pool
+    before the response is serialized. Write routes do the same after
+    commit, having built their response (and any socket payload) before it;
+    touching an ORM object after commit reloads it in a new transaction.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def release(self):
+        self.db.session.close()
+
+    def read_only(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.db.engine.dialect.name == "postgresql":
+                self.db.session.execute(text("SET TRANSACTION READ ONLY"))
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self.db.session.close()
+
+        return wrapper
+
+
+class RequestDbProfile:
+    """Database usage of one request.
+
+    ``rows_fetched`` counts ORM entities loaded (the Mapper ``load`` event).
+    Column and aggregate queries such as ``.count()``, ``query(Model.id)``
+    or the ``unread_count`` column in /rooms load no entities and add
+    nothing, however many rows they read; ``statements`` still counts them.
+    """
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.transaction_seconds = 0.0
+        self.connection_seconds = 0.0
+        self._transaction_started = None
+        self._checked_out = {}
+
+    def as_dict(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "statements": self.statements,
+            "rows_fetched": self.rows_fetched,
+            "rows_written": self.rows_written,
+            "transaction_ms": round(self.transaction_seconds * 1000, 2),
+            "connection_hold_ms": round(self.connection_seconds * 1000, 2),
+        }
+
+
+def _current_profile():
+    if has_app_context():
+        return g.get("db_profile")
+    return None
+
+
+@event.listens_for(Pool, "checkout")
+def _record_checkout(dbapi_connection, connection_record, connection_proxy):
+    profile = _current_profile()
+    if profile is not None:
+        profile._checked_out[id(dbapi_connection)] = time.perf_counter()
+
+
+@event.listens_for(Pool, "checkin")
+def _record_checkin(dbapi_connection, connection_record):
+    profile = _current_profile()
+    if profile is not None:
+        checked_out = profile._checked_out.pop(id(dbapi_connection), None)
+        if checked_out is not None:
+            profile.connection_seconds += time.perf_counter() - checked_out
+
+
+@event.listens_for(Engine, "begin")
+def _record_begin(conn):
+    profile = _current_profile()
+    if profile is not None:
+        profile._transaction_started = time.perf_counter()
+
+
+def _record_transaction_end(conn):
+    profile = _current_profile()
+    if profile is not None and profile._transaction_started is not None:
+        profile.transaction_seconds += time.perf_counter() - profile._transaction_started
+        profile._transaction_started = None
+
+
+event.listen(Engine, "commit", _record_transaction_end)
+event.listen(Engine, "rollback", _record_transaction_end)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is not None:
+        profile.statements += 1
+        if not statement.lstrip().upper().startswith("SELECT") and cursor.rowcount > 0:
+            profile.rows_written += cursor.rowcount
+
+
+@event.listens_for(Mapper, "load")
+def _record_row_loaded(target, context):
+    profile = _current_profile()
+    if profile is not None:
+        profile.rows_fetched += 1
+
+
+def install_request_profiling(
+    app, slow_transaction_ms=200, slow_connection_hold_ms=250, max_rows_fetched=5000
+):
+    """Record per-request DB usage and log requests over the thresholds.
+
+    Must be called before ``SQLAlchemy(app)``: teardown functions run in
+    reverse order, so the report then runs after Flask-SQLAlchemy has closed
+    the session and returned its connection.
+    """
+
+    @app.before_request
+    def start_db_profile():
+        g.db_profile = RequestDbProfile(request.method, request.path)
+
+    @app.teardown_appcontext
+    def report_db_profile(exc):
+        profile = g.pop("db_profile", None)
+        if profile is None:
+            return
+        # A connection still checked out at this point was held to the end.
+        now = time.perf_counter()
+        for checked_out in profile._checked_out.values():
+            profile.connection_seconds += now - checked_out
+        profile._checked_out.clear()
+
+        report = profile.as_dict()
+        reasons = []
+        if report["transaction_ms"] > slow_transaction_ms:
+            reasons.append("slow transaction")
+        if report["connection_hold_ms"] > slow_connection_hold_ms:
+            reasons.append("long connection hold")
+        if report["rows_fetched"] > max_rows_fetched:
+            reasons.append("many rows fetched")
+
+        if reasons:
+            logging.warning(f"DB profile flagged ({', '.join(reasons)}): {report}")
+        else:
+            logging.debug(f"DB profile: {report}")
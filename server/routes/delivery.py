@@ -0,0 +1,223 @@
+import logging
+import queue
+import threading
+import zlib
+from collections import deque
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Events a client can afford to miss. Anything else (message_changed) is
+# durable: clients track its seq, so it is never dropped silently.
+DEFAULT_DROPPABLE_EVENTS = frozenset({"ephemeral_batch"})
+
+
+class ConnectionQueue:
+    """Bounded outbound queue of (encoded, droppable) packets for one socket."""
+
+    def __init__(self, sid, max_size):
+        self.sid = sid
+        self.packets = deque()
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+
+
+class DeliveryLayer:
+    """Room broadcasts with per-connection backpressure.
+
+    ``emit`` encodes a packet once and hands it to the shard that owns the
+    room. Each shard is its own worker, so a hot room only delays the rooms
+    that hash to the same shard. The shard copies the packet reference into
+    every subscriber's bounded queue and writes from there while the
+    socket's own backlog stays below ``max_in_flight``; sockets that are
+    behind keep their packets queued and are retried every ``pump_interval``.
+    A subscriber whose queue is full either loses its oldest droppable
+    packet or is disconnected, depending on ``policy``. Only events in
+    ``droppable_events`` are ever dropped; when a full queue holds none of
+    them, the subscriber is disconnected under either policy and catches up
+    through /messages/changes when it reconnects.
+
+    ``encode(event, data)``, ``send(sid, encoded)``, ``disconnect(sid)`` and
+    ``backlog(sid)`` adapt this to the socket server; ``spawn`` starts the
+    shard workers.
+    """
+
+    def __init__(
+        self,
+        encode,
+        send,
+        disconnect,
+        spawn,
+        backlog=None,
+        shards=4,
+        max_queue=256,
+        max_in_flight=32,
+        policy=DROP_OLDEST,
+        pump_interval=0.1,
+        fan_out_batch=64,
+        droppable_events=DEFAULT_DROPPABLE_EVENTS,
+    ):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.encode = encode
+        self.send = send
+        self.disconnect = disconnect
+        self.spawn = spawn
+        self.backlog = backlog or (lambda sid: 0)
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.policy = policy
+        self.pump_interval = pump_interval
+        self.fan_out_batch = fan_out_batch
+        self.droppable_events = frozenset(droppable_events)
+
+        self._inboxes = [queue.Queue() for _ in range(shards)]
+        self._waiting = [set() for _ in range(shards)]
+        self._rooms = {}
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.broadcasts = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for shard in range(len(self._inboxes)):
+            self.spawn(self._shard_loop, shard)
+
+    def subscribe(self, sid, group_room_number):
+        with self._lock:
+            self._rooms.setdefault(group_room_number, set()).add(sid)
+            if sid not in self._connections:
+                self._connections[sid] = ConnectionQueue(sid, self.max_queue)
+
+    def unsubscribe(self, sid, group_room_number):
+        with self._lock:
+            members = self._rooms.get(group_room_number)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self._rooms[group_room_number]
+
+    def remove(self, sid):
+        with self._lock:
+            for group_room_number in list(self._rooms):
+                self._rooms[group_room_number].discard(sid)
+                if not self._rooms[group_room_number]:
+                    del self._rooms[group_room_number]
+            self._connections.pop(sid, None)
+
+    def emit(self, event, data, to):
+        """Drop-in for ``socketio.emit(event, data, to=room)``."""
+        self.start()
+        packet = (self.encode(event, data), event in self.droppable_events)
+        self.broadcasts += 1
+        self._inboxes[self._shard_for(to)].put((to, packet))
+
+    def stats(self, top=20):
+        with self._lock:
+            connections = list(self._connections.values())
+            room_count = len(self._rooms)
+        depths = sorted((len(conn.packets) for conn in connections), reverse=True)
+        return {
+            "rooms": room_count,
+            "connections": len(connections),
+            "broadcasts": self.broadcasts,
+            "queued": sum(depths),
+            "sent": sum(conn.sent for conn in connections),
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+            "shard_backlog": [inbox.qsize() for inbox in self._inboxes],
+            # Depths only; socket ids are not for other clients to see.
+            "deepest_queues": [depth for depth in depths[:top] if depth],
+        }
+
+    def _shard_for(self, group_room_number):
+        return zlib.crc32(str(group_room_number).encode()) % len(self._inboxes)
+
+    def _shard_loop(self, shard):
+        while True:
+            try:
+                self._pump(shard)
+            except Exception as e:
+                logging.error(f"Error in delivery shard {shard}: {e}", exc_info=True)
+
+    def _pump(self, shard):
+        inbox = self._inboxes[shard]
+        waiting = self._waiting[shard]
+        try:
+            item = inbox.get(timeout=self.pump_interval)
+        except queue.Empty:
+            item = None
+
+        # Handle a burst of broadcasts, but cap it so a hot room cannot hold
+        # back the retries for slow sockets waiting in this shard.
+        fanned_out = 0
+        while item is not None:
+            group_room_number, packet = item
+            with self._lock:
+                recipients = [
+                    self._connections[sid]
+                    for sid in self._rooms.get(group_room_number, ())
+                    if sid in self._connections
+                ]
+            for conn in recipients:
+                self._enqueue(conn, packet)
+                if not self._drain(conn):
+                    waiting.add(conn)
+            fanned_out += 1
+            if fanned_out >= self.fan_out_batch:
+                break
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                item = None
+
+        for conn in list(waiting):
+            if self._drain(conn):
+                waiting.discard(conn)
+
+    def _enqueue(self, conn, packet):
+        with conn.lock:
+            if len(conn.packets) < conn.max_size:
+                conn.packets.append(packet)
+                return
+            if self.policy == DROP_OLDEST and self._drop_oldest(conn, packet):
+                conn.dropped += 1
+                self.dropped += 1
+                return
+            conn.dropped += len(conn.packets) + 1
+            self.dropped += len(conn.packets) + 1
+            conn.packets.clear()
+        self.disconnected += 1
+        self.remove(conn.sid)
+        self.disconnect(conn.sid)
+
+    def _drop_oldest(self, conn, packet):
+        """Make room for ``packet`` by dropping a droppable one; False if none."""
+        for index, (_, droppable) in enumerate(conn.packets):
+            if droppable:
+                del conn.packets[index]
+                conn.packets.append(packet)
+                return True
+        # Every queued packet is durable; the new one can go if it is not.
+        return packet[1]
+
+    def _drain(self, conn):
+        """Write queued packets the socket can take; True once empty."""
+        if conn.sid not in self._connections:
+            return True
+        with conn.lock:
+            in_flight = self.backlog(conn.sid)
+            while conn.packets and in_flight < self.max_in_flight:
+                encoded, _ = conn.packets.popleft()
+                self.send(conn.sid, encoded)
+                conn.sent += 1
+                in_flight += 1
+            return not conn.packets
@@ -0,0 +1,108 @@
+import threading
+import time
+
+# Minimum seconds between two deliveries of the same event type from the
+# same sender in the same room.
+DEFAULT_THROTTLE_INTERVALS = {
+    "typing": 1.0,
+    "presence": 5.0,
+    "read": 1.0,
+}
+
+# Event types a client may publish itself, and the exact payload fields
+# each one carries. Presence and read receipts are only sent by the server.
+CLIENT_EVENT_FIELDS = {
+    "typing": {"typing": bool},
+}
+
+
+def client_event_payload(event_type, payload):
+    """Return a client payload if it has exactly the expected shape, else None."""
+    fields = CLIENT_EVENT_FIELDS.get(event_type)
+    if fields is None or not isinstance(payload, dict):
+        return None
+    if payload.keys() != fields.keys():
+        return None
+    for name, field_type in fields.items():
+        if not isinstance(payload[name], field_type):
+            return None
+    return dict(payload)
+
+
+class EphemeralEventHub:
+    """Throttles and batches events that are never stored, such as typing.
+
+    ``publish`` only records the sender's latest state. ``flush`` is called
+    once per tick and emits a single ``ephemeral_batch`` per room holding
+    every event that is due, so a room sees at most one emit per tick no
+    matter how fast its members type. An event that arrives inside the
+    throttle window is held back rather than dropped, so the last state
+    (e.g. "stopped typing") always reaches the room.
+    """
+
+    def __init__(self, emit, throttle_intervals=None, clock=time.monotonic):
+        self.emit = emit
+        self.throttle_intervals = dict(throttle_intervals or DEFAULT_THROTTLE_INTERVALS)
+        self.clock = clock
+        self._pending = {}
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.batches = 0
+
+    def publish(self, group_room_number, sender_id, event_type, payload=None):
+        interval = self.throttle_intervals.get(event_type)
+        if interval is None or not group_room_number:
+            return False
+
+        key = (group_room_number, sender_id, event_type)
+        now = self.clock()
+        with self._lock:
+            self.published += 1
+            room = self._pending.setdefault(group_room_number, {})
+            last_sent = self._last_sent.get(key)
+            due = now if last_sent is None else max(now, last_sent + interval)
+            pending = room.get((sender_id, event_type))
+            if pending is not None:
+                due = pending[1]
+            room[(sender_id, event_type)] = (payload, due)
+        return True
+
+    def flush(self):
+        """Emit one batch per room for every event that is due."""
+        now = self.clock()
+        batches = []
+        with self._lock:
+            for group_room_number in list(self._pending):
+                room = self._pending[group_room_number]
+                events = []
+                for (sender_id, event_type), (payload, due) in list(room.items()):
+                    if due > now:
+                        continue
+                    del room[(sender_id, event_type)]
+                    self._last_sent[(group_room_number, sender_id, event_type)] = now
+                    events.append(
+                        {"type": event_type, "user_id": sender_id, "payload": payload}
+                    )
+                if not room:
+                    del self._pending[group_room_number]
+                if events:
+                    batches.append((group_room_number, events))
+
+            longest = max(self.throttle_intervals.values(), default=0)
+            self._last_sent = {
+                key: sent
+                for key, sent in self._last_sent.items()
+                if now - sent < longest
+            }
+            self.delivered += sum(len(events) for _, events in batches)
+            self.batches += len(batches)
+
+        for group_room_number, events in batches:
+            self.emit(
+                "ephemeral_batch",
+                {"group_room_number": group_room_number, "events": events},
+                to=group_room_number,
+            )
+        return len(batches)
@@ -1,14 +1,15 @@
 import os
 from flask import Flask, request, jsonify, render_template, redirect, url_for
-from flask import send_from_directory
+from flask import send_from_directory, send_file, json
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
 from dotenv import load_dotenv, find_dotenv
 import jwt
 import logging
+from urllib.parse import unquote
 from datetime import datetime
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from flask_cors import CORS, cross_origin
 from .token_keys_list import (
     login_key,
@@ -17,6 +18,19 @@ from .token_keys_list import (
     app_config_key,
     flask_app_key,
 )
+from .message_cache import RoomMessageCache
+from .read_state import ReadMarkerBuffer
+from .ephemeral import EphemeralEventHub, client_event_payload
+from .delivery import DeliveryLayer
+from .attachments import (
+    INLINE_CONTENT_TYPES,
+    AttachmentTooLarge,
+    BlobStore,
+    ThumbnailWorker,
+)
+from .database import configure_database
+from .db_session import SessionManager, install_request_profiling
+from socketio import packet
 from datetime import datetime, timedelta
 
 load_dotenv()
@@ -27,12 +41,65 @@ print("app", app)
 CORS(app)
 
 
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+configure_database(app)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
 
-socketio = SocketIO(app)
+# flask.json so socket payloads can carry datetimes, the same as jsonify.
+socketio = SocketIO(app, json=json)
+
+
+def encode_socket_event(event, data):
+    # Encoded once per broadcast and shared by every recipient.
+    return socketio.server.packet_class(
+        packet.EVENT, namespace="/", data=[event, data]
+    ).encode()
+
+
+def send_encoded_packet(sid, encoded):
+    eio_sid = socketio.server.manager.eio_sid_from_sid(sid, "/")
+    if eio_sid:
+        socketio.server.eio.send(eio_sid, encoded)
+
+
+def socket_backlog(sid):
+    # Packets engine.io has accepted but not yet written to the socket.
+    # engine.io has no public API for this, so it reads Socket.queue, which
+    # python-engineio 4.9 (pinned in requirements.txt) keeps per socket;
+    # tests/test_delivery.py checks it still does.
+    eio_sid = socketio.server.manager.eio_sid_from_sid(sid, "/")
+    eio_socket = socketio.server.eio.sockets.get(eio_sid) if eio_sid else None
+    if eio_socket is None:
+        return 0
+    return eio_socket.queue.qsize()
+
+
+delivery = DeliveryLayer(
+    encode=encode_socket_event,
+    send=send_encoded_packet,
+    disconnect=lambda sid: socketio.server.disconnect(sid, namespace="/"),
+    spawn=socketio.start_background_task,
+    backlog=socket_backlog,
+    shards=int(os.environ.get("DELIVERY_SHARDS", 4)),
+    max_queue=int(os.environ.get("DELIVERY_MAX_QUEUE", 256)),
+    max_in_flight=int(os.environ.get("DELIVERY_MAX_IN_FLIGHT", 32)),
+    policy=os.environ.get("DELIVERY_SLOW_CONSUMER_POLICY", "drop_oldest"),
+)
+
+EPHEMERAL_TICK = float(os.environ.get("EPHEMERAL_TICK", 0.25))
+ephemeral_hub = EphemeralEventHub(delivery.emit)
 
+# request.sid -> {"user_id": ..., "rooms": set()} for sockets that joined a room
+socket_sessions = {}
+
+# Before SQLAlchemy(app) so the report runs after the session is closed.
+install_request_profiling(
+    app,
+    slow_transaction_ms=float(os.environ.get("SLOW_TRANSACTION_MS", 200)),
+    slow_connection_hold_ms=float(os.environ.get("SLOW_CONNECTION_HOLD_MS", 250)),
+    max_rows_fetched=int(os.environ.get("MAX_ROWS_FETCHED", 5000)),
+)
 db = SQLAlchemy(app)
+sessions = SessionManager(db)
 print("db", db)
 migrate = Migrate(app, db)
 print("migrate", migrate)
@@ -52,7 +119,9 @@ print("app.secret_key", app.secret_key)
 @app.after_request
 def after_request(response):
     print("response", response)
-    response.headers.add("Content-Type", "text/plain"),
+    if not response.direct_passthrough:
+        # File responses (send_file) keep their own Content-Type.
+        response.headers.add("Content-Type", "text/plain"),
     print("app.after_request reponse:", response)
     return response
 
@@ -77,6 +146,87 @@ def handle_connect():
     emit("backend_to_frontend", "Hello from the backend")
 
 
+@socketio.on("join_room")
+def handle_join_room(data):
+    # message_changed carries full message text, so only signed-in members
+    # of the room (see /rooms/join) are subscribed; anything else is ignored.
+    data = data or {}
+    group_room_number = data.get("group_room_number")
+    user_id = get_current_user_id(data.get("user_token"))
+    if not group_room_number or not user_id:
+        return
+    is_member = db.session.get(RoomMember, (user_id, group_room_number)) is not None
+    db.session.close()
+    if not is_member:
+        return
+
+    join_room(group_room_number)
+    delivery.subscribe(request.sid, group_room_number)
+    session = socket_sessions.setdefault(
+        request.sid, {"user_id": user_id, "rooms": set()}
+    )
+    session["rooms"].add(group_room_number)
+    ephemeral_hub.publish(group_room_number, user_id, "presence", {"online": True})
+
+
+def unsubscribe_socket(sid, group_room_number):
+    socketio.server.leave_room(sid, group_room_number, namespace="/")
+    delivery.unsubscribe(sid, group_room_number)
+    session = socket_sessions.get(sid)
+    if session:
+        session["rooms"].discard(group_room_number)
+        ephemeral_hub.publish(
+            group_room_number, session["user_id"], "presence", {"online": False}
+        )
+
+
+@socketio.on("leave_room")
+def handle_leave_room(data):
+    group_room_number = (data or {}).get("group_room_number")
+    if group_room_number:
+        unsubscribe_socket(request.sid, group_room_number)
+
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    delivery.remove(request.sid)
+    session = socket_sessions.pop(request.sid, None)
+    if session:
+        for group_room_number in session["rooms"]:
+            ephemeral_hub.publish(
+                group_room_number, session["user_id"], "presence", {"online": False}
+            )
+
+
+@socketio.on("ephemeral")
+def handle_ephemeral(data):
+    # Typing indicators and the like: throttled and batched by ephemeral_hub,
+    # never written to the messages table.
+    session = socket_sessions.get(request.sid)
+    if not session or not isinstance(data, dict):
+        return
+    group_room_number = data.get("group_room_number")
+    if not isinstance(group_room_number, str):
+        return
+    if group_room_number not in session["rooms"]:
+        return
+    # Whatever is accepted here is fanned out to the whole room, so only the
+    # known payload shapes get through.
+    payload = client_event_payload(data.get("type"), data.get("payload"))
+    if payload is None:
+        return
+    ephemeral_hub.publish(group_room_number, session["user_id"], data["type"], payload)
+
+
+def ephemeral_flush_loop():
+    while True:
+        socketio.sleep(EPHEMERAL_TICK)
+        try:
+            ephemeral_hub.flush()
+        except Exception as e:
+            logging.error(f"Error flushing ephemeral events: {e}", exc_info=True)
+
+
 logging.basicConfig(
     level=logging.DEBUG,
     filename="app.log",
@@ -90,6 +240,35 @@ print("SQLALCHEMY_DATABASE_URI", app.config["SQLALCHEMY_DATABASE_URI"])
 print("DATABASE_URL", os.environ.get("DATABASE_URL"))
 app.config["app_config_key"] = app_config_key
 
+# Deleted messages are kept as tombstones so clients syncing with
+# /messages/changes can see the delete; after this window they are purged.
+TOMBSTONE_RETENTION = timedelta(
+    hours=int(os.environ.get("TOMBSTONE_RETENTION_HOURS", 72))
+)
+TOMBSTONE_COMPACTION_INTERVAL = int(
+    os.environ.get("TOMBSTONE_COMPACTION_INTERVAL", 3600)
+)
+
+room_message_cache = RoomMessageCache(
+    max_rooms=int(os.environ.get("ROOM_CACHE_MAX_ROOMS", 64))
+)
+
+MAX_ATTACHMENT_SIZE = int(os.environ.get("MAX_ATTACHMENT_SIZE", 1024 * 1024 * 1024))
+attachment_store = BlobStore(
+    os.environ.get(
+        "ATTACHMENT_STORAGE_PATH",
+        os.path.join(os.path.dirname(__file__), "..", "attachments"),
+    )
+)
+thumbnail_worker = ThumbnailWorker(attachment_store)
+
+ROOM_PREVIEW_LENGTH = 200
+
+# messages.id is a 32-bit Integer column; larger ids cannot be looked up.
+MAX_MESSAGE_ID = 2**31 - 1
+READ_MARKER_FLUSH_INTERVAL = float(os.environ.get("READ_MARKER_FLUSH_INTERVAL", 2))
+read_marker_buffer = ReadMarkerBuffer()
+
 
 class User(db.Model):
     __tablename__ = "userdata"  # this specifies the name of the table in the database
@@ -102,6 +281,27 @@ class User(db.Model):
     birthdate = db.Column(db.Date)
 
 
+class Attachment(db.Model):
+    __tablename__ = "attachments"
+
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    filename = db.Column(db.String(255))
+    user_id = db.Column(db.Integer, db.ForeignKey("userdata.id"), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def attachment_to_dict(attachment):
+    return {
+        "id": attachment.id,
+        "filename": attachment.filename,
+        "content_type": attachment.content_type,
+        "size": attachment.size,
+    }
+
+
 class Message(db.Model):
     __tablename__ = "messages"
 
@@ -109,8 +309,421 @@ class Message(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("userdata.id"), nullable=False)
     text = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    group_room_number = db.Column(db.String(20), nullable=False)
+    group_room_number = db.Column(
+        db.String(20), db.ForeignKey("rooms.group_room_number"), nullable=False
+    )
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+    edited_at = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
+    attachment_id = db.Column(db.Integer, db.ForeignKey("attachments.id"), index=True)
     user = db.relationship("User", backref=db.backref("messages", lazy=True))
+    attachment = db.relationship("Attachment", lazy="joined")
+
+    __table_args__ = (
+        db.Index("ix_messages_room_seq", "group_room_number", "seq"),
+        db.Index("ix_messages_room_id", "group_room_number", "id"),
+    )
+
+
+class Room(db.Model):
+    __tablename__ = "rooms"
+
+    group_room_number = db.Column(db.String(20), primary_key=True)
+    name = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # last_seq is bumped on every create/edit/delete in the room; compacted_seq
+    # is the highest seq whose tombstone has been purged.
+    last_seq = db.Column(db.BigInteger, nullable=False, default=0)
+    compacted_seq = db.Column(db.BigInteger, nullable=False, default=0)
+    # Copied from the newest live message on every write so listing rooms
+    # never has to look at the messages table.
+    last_message_id = db.Column(db.Integer)
+    last_message_user_id = db.Column(db.Integer)
+    last_message_text = db.Column(db.String(ROOM_PREVIEW_LENGTH))
+    last_message_at = db.Column(db.DateTime)
+
+
+class RoomMember(db.Model):
+    __tablename__ = "room_members"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("userdata.id"), primary_key=True)
+    group_room_number = db.Column(
+        db.String(20), db.ForeignKey("rooms.group_room_number"), primary_key=True
+    )
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_room_members_room", "group_room_number"),)
+
+
+def get_or_create_room(group_room_number, lock=False):
+    room = db.session.get(Room, group_room_number, with_for_update=lock)
+    if room is None:
+        room = Room(group_room_number=group_room_number, last_seq=0, compacted_seq=0)
+        db.session.add(room)
+        # Nothing orders this insert before the messages/read_states rows
+        # that reference it, so write it now.
+        db.session.flush()
+    return room
+
+
+def ensure_room_member(user_id, group_room_number):
+    member = db.session.get(RoomMember, (user_id, group_room_number))
+    if member is None:
+        member = RoomMember(user_id=user_id, group_room_number=group_room_number)
+        db.session.add(member)
+        # record_message_sent only counts messages for existing read states,
+        # so a new member needs one, starting at what the room has now.
+        if db.session.get(ReadState, (user_id, group_room_number)) is None:
+            room = db.session.get(Room, group_room_number)
+            db.session.add(
+                ReadState(
+                    user_id=user_id,
+                    group_room_number=group_room_number,
+                    last_read_message_id=room.last_message_id or 0,
+                    unread_count=0,
+                )
+            )
+    return member
+
+
+def next_room_seq(group_room_number):
+    # The row lock is held until commit, so changes commit in seq order and a
+    # client reading "changes since N" never skips a seq that lands later.
+    room = get_or_create_room(group_room_number, lock=True)
+    room.last_seq += 1
+    return room.last_seq
+
+
+def set_room_preview(room, message):
+    if message is None:
+        room.last_message_id = None
+        room.last_message_user_id = None
+        room.last_message_text = None
+        room.last_message_at = None
+        return
+
+    preview = message.text
+    if not preview and message.attachment_id:
+        attachment = db.session.get(Attachment, message.attachment_id)
+        preview = f"[attachment] {attachment.filename or ''}".strip()
+    room.last_message_id = message.id
+    room.last_message_user_id = message.user_id
+    room.last_message_text = (preview or "")[:ROOM_PREVIEW_LENGTH]
+    room.last_message_at = message.timestamp
+
+
+def update_room_preview(message):
+    """Keep the room's last message preview in step with a changed message."""
+    room = db.session.get(Room, message.group_room_number)
+    if message.deleted_at:
+        if room.last_message_id == message.id:
+            # Only the newest message can take its place; (room, id) is indexed.
+            set_room_preview(
+                room,
+                Message.query.filter(
+                    Message.group_room_number == message.group_room_number,
+                    Message.deleted_at.is_(None),
+                    Message.id != message.id,
+                )
+                .order_by(Message.id.desc())
+                .first(),
+            )
+    elif room.last_message_id is None or message.id >= room.last_message_id:
+        set_room_preview(room, message)
+
+
+def room_to_dict(room):
+    return {
+        "group_room_number": room.group_room_number,
+        "name": room.name,
+        "last_message": (
+            {
+                "id": room.last_message_id,
+                "user_id": room.last_message_user_id,
+                "text": room.last_message_text,
+                "timestamp": room.last_message_at,
+            }
+            if room.last_message_id
+            else None
+        ),
+    }
+
+
+def message_to_change(message):
+    if message.deleted_at:
+        op = "delete"
+    elif message.edited_at:
+        op = "edit"
+    else:
+        op = "create"
+
+    change = {
+        "op": op,
+        "id": message.id,
+        "seq": message.seq,
+        "group_room_number": message.group_room_number,
+    }
+    if op != "delete":
+        change.update(
+            {
+                "user_id": message.user_id,
+                "username": message.user.username,
+                "text": message.text,
+                "timestamp": message.timestamp,
+                "edited_at": message.edited_at,
+                "attachment": (
+                    attachment_to_dict(message.attachment)
+                    if message.attachment
+                    else None
+                ),
+            }
+        )
+    return change
+
+
+def publish_message_change(change):
+    # Takes the change dict, not the Message: it is built before commit so
+    # publishing never reloads expired attributes on a fresh transaction.
+    room_message_cache.apply(change["group_room_number"], [change])
+    delivery.emit("message_changed", change, to=change["group_room_number"])
+    return change
+
+
+def get_room_messages(group_room_number):
+    """Return the live messages of a room and the seq they are current to.
+
+    Served from ``room_message_cache``; only the changes made since the cached
+    seq are read from the database.
+    """
+    room = db.session.get(Room, group_room_number)
+    last_seq = room.last_seq if room else 0
+    compacted_seq = room.compacted_seq if room else 0
+    cached_seq = room_message_cache.seq(group_room_number)
+
+    if cached_seq is None or cached_seq < compacted_seq:
+        messages = (
+            Message.query.join(User)
+            .filter(
+                Message.group_room_number == group_room_number,
+                Message.deleted_at.is_(None),
+            )
+            .options(db.contains_eager(Message.user))
+            .order_by(Message.timestamp.asc())
+            .all()
+        )
+        room_message_cache.load(
+            group_room_number,
+            last_seq,
+            [message_to_change(message) for message in messages],
+        )
+    elif cached_seq < last_seq:
+        changes = (
+            Message.query.join(User)
+            .filter(
+                Message.group_room_number == group_room_number,
+                Message.seq > cached_seq,
+            )
+            .options(db.contains_eager(Message.user))
+            .order_by(Message.seq.asc())
+            .all()
+        )
+        room_message_cache.apply(
+            group_room_number,
+            [message_to_change(message) for message in changes],
+            seq=last_seq,
+        )
+
+    return room_message_cache.get(group_room_number)
+
+
+def compact_tombstones(retention=None):
+    """Purge tombstones older than the retention window.
+
+    Each room's compacted_seq is raised to the newest purged seq so that a
+    client asking for changes from before it is told to reload instead.
+    """
+    if retention is None:
+        retention = TOMBSTONE_RETENTION
+    cutoff = datetime.utcnow() - retention
+    expired = (
+        db.session.query(Message.group_room_number, db.func.max(Message.seq))
+        .filter(Message.deleted_at.isnot(None), Message.deleted_at < cutoff)
+        .group_by(Message.group_room_number)
+        .all()
+    )
+
+    purged = 0
+    for group_room_number, max_seq in expired:
+        room = db.session.get(Room, group_room_number, with_for_update=True)
+        if room is not None:
+            room.compacted_seq = max(room.compacted_seq, max_seq)
+        purged += Message.query.filter(
+            Message.group_room_number == group_room_number,
+            Message.deleted_at.isnot(None),
+            Message.deleted_at < cutoff,
+            Message.seq <= max_seq,
+        ).delete(synchronize_session=False)
+    db.session.commit()
+
+    if purged:
+        logging.info(f"Compacted {purged} message tombstones")
+    return purged
+
+
+def tombstone_compaction_loop():
+    while True:
+        socketio.sleep(TOMBSTONE_COMPACTION_INTERVAL)
+        with app.app_context():
+            try:
+                compact_tombstones()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error compacting tombstones: {e}", exc_info=True)
+            finally:
+                db.session.close()
+
+
+class ReadState(db.Model):
+    __tablename__ = "read_states"
+
+    # unread_count is kept up to date by send_message/delete_message, so
+    # listing unread counts never has to count messages.
+    user_id = db.Column(db.Integer, db.ForeignKey("userdata.id"), primary_key=True)
+    group_room_number = db.Column(
+        db.String(20), db.ForeignKey("rooms.group_room_number"), primary_key=True
+    )
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index("ix_read_states_room", "group_room_number"),)
+
+
+def record_message_sent(message):
+    """Update read states for a message that was just inserted (and flushed)."""
+    ReadState.query.filter(
+        ReadState.group_room_number == message.group_room_number,
+        ReadState.user_id != message.user_id,
+    ).update(
+        {ReadState.unread_count: ReadState.unread_count + 1},
+        synchronize_session=False,
+    )
+
+    # Whoever sends a message has seen the room up to it.
+    read_state = db.session.get(
+        ReadState, (message.user_id, message.group_room_number)
+    )
+    if read_state is None:
+        read_state = ReadState(
+            user_id=message.user_id, group_room_number=message.group_room_number
+        )
+        db.session.add(read_state)
+    read_state.last_read_message_id = message.id
+    read_state.unread_count = 0
+
+
+def record_message_deleted(message):
+    ReadState.query.filter(
+        ReadState.group_room_number == message.group_room_number,
+        ReadState.user_id != message.user_id,
+        ReadState.last_read_message_id < message.id,
+        ReadState.unread_count > 0,
+    ).update(
+        {ReadState.unread_count: ReadState.unread_count - 1},
+        synchronize_session=False,
+    )
+
+
+def is_valid_read_marker(user_id, group_room_number, message_id):
+    """A marker must point at a message in a room the user belongs to."""
+    if isinstance(message_id, bool) or not 0 < message_id <= MAX_MESSAGE_ID:
+        return False
+    message = db.session.get(Message, message_id)
+    if message is None or message.group_room_number != group_room_number:
+        return False
+    return db.session.get(RoomMember, (user_id, group_room_number)) is not None
+
+
+def write_read_markers(markers):
+    """Write coalesced mark-read requests, {(user_id, room): message_id}."""
+    for (user_id, group_room_number), message_id in markers.items():
+        # Checked again here: membership or the message may be gone by now.
+        if not is_valid_read_marker(user_id, group_room_number, message_id):
+            continue
+        read_state = db.session.get(
+            ReadState, (user_id, group_room_number), with_for_update=True
+        )
+        if read_state is None:
+            read_state = ReadState(
+                user_id=user_id,
+                group_room_number=group_room_number,
+                last_read_message_id=0,
+            )
+            db.session.add(read_state)
+        elif message_id <= read_state.last_read_message_id:
+            continue
+
+        # Only the messages after the new marker are left to count, which is
+        # usually none at all.
+        read_state.last_read_message_id = message_id
+        read_state.unread_count = Message.query.filter(
+            Message.group_room_number == group_room_number,
+            Message.id > message_id,
+            Message.user_id != user_id,
+            Message.deleted_at.is_(None),
+        ).count()
+    db.session.commit()
+
+
+def flush_read_markers(markers):
+    try:
+        write_read_markers(markers)
+        return
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error writing read markers: {e}", exc_info=True)
+
+    # Retry one at a time so a bad marker cannot hold back everyone else's.
+    # A marker that still fails is dropped, not retried on every tick.
+    for key, message_id in markers.items():
+        try:
+            write_read_markers({key: message_id})
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Dropping read marker {key} -> {message_id}: {e}")
+
+
+def read_marker_flush_loop():
+    while True:
+        socketio.sleep(READ_MARKER_FLUSH_INTERVAL)
+        markers = read_marker_buffer.drain()
+        if not markers:
+            continue
+        with app.app_context():
+            try:
+                flush_read_markers(markers)
+            finally:
+                db.session.close()
+
+
+background_tasks_started = False
+
+
+def start_background_tasks():
+    # Called once at import time, so the loops run under gunicorn even when
+    # no client ever opens a socket.
+    global background_tasks_started
+    if background_tasks_started:
+        return
+    background_tasks_started = True
+    socketio.start_background_task(tombstone_compaction_loop)
+    socketio.start_background_task(read_marker_flush_loop)
+    socketio.start_background_task(ephemeral_flush_loop)
+    delivery.start()
+
+
+@app.cli.command("compact-tombstones")
+def compact_tombstones_command():
+    print("Purged tombstones:", compact_tombstones())
 
 
 @app.route("/register", methods=["POST"])
@@ -141,6 +754,7 @@ def register():
 
 
 @app.route("/login", methods=["POST"])
+@sessions.read_only
 def login():
     data = request.json
     user_name_or_email = data.get("username") or data.get("email")
@@ -152,6 +766,8 @@ def login():
 
     if not user:
         return jsonify({"error": "User not found!"}), 404
+    # The password hash is deliberately slow; don't hold the connection for it.
+    sessions.release()
     if check_password_hash(user.password, password):
         login_token = jwt.encode({"user_id": user.id}, login_key, algorithm="HS256")
         user_token = generate_user_token(login_token)
@@ -307,6 +923,13 @@ def get_current_group_id(group_token):
         return None
 
 
+def get_user_id_from_request():
+    user_token = request.headers.get("Authorization")
+    if user_token:
+        user_token = user_token.replace("Bearer ", "")
+    return get_current_user_id(user_token)
+
+
 @app.route("/edit", methods=["POST"])
 def edit_profile():
     data = request.json
@@ -342,18 +965,15 @@ def edit_profile():
                 data["password"], method="pbkdf2:sha256"
             )
 
+        user_data = {
+            "name": user.name,
+            "username": user.username,
+            "email": user.email,
+        }
         db.session.commit()
+        sessions.release()
 
-        return (
-            jsonify(
-                {
-                    "name": user.name,
-                    "username": user.username,
-                    "email": user.email,
-                }
-            ),
-            200,
-        )
+        return jsonify(user_data), 200
 
     except Exception as e:
         db.session.rollback()
@@ -374,6 +994,7 @@ def send_message():
         group_room_number = data.get("group_room_number")
         print("group_room_number msg/send", group_room_number)
         text = data.get("text")
+        attachment_id = data.get("attachment_id")
 
         print("User token:", user_token)
 
@@ -392,13 +1013,40 @@ def send_message():
 
         if not user_id:
             return jsonify({"error": "Authentication required"}), 401
+        if not group_room_number:
+            return jsonify({"error": "Missing group room number"}), 400
+
+        if text is not None and not isinstance(text, str):
+            return jsonify({"error": "Invalid message text"}), 400
+        if not text and attachment_id is None:
+            return jsonify({"error": "Missing message text"}), 400
+        if attachment_id is not None and (
+            not isinstance(attachment_id, int) or isinstance(attachment_id, bool)
+        ):
+            return jsonify({"error": "Invalid attachment id"}), 400
+
+        if attachment_id is not None:
+            attachment = db.session.get(Attachment, attachment_id)
+            if not attachment or attachment.user_id != user_id:
+                return jsonify({"error": "Attachment not found"}), 404
 
         message = Message(
-            user_id=user_id, group_room_number=group_room_number, text=text
+            user_id=user_id,
+            group_room_number=group_room_number,
+            text=text or "",
+            attachment_id=attachment_id,
+            seq=next_room_seq(group_room_number),
         )
         print("Message:", message)
         db.session.add(message)
+        db.session.flush()
+        ensure_room_member(user_id, group_room_number)
+        update_room_preview(message)
+        record_message_sent(message)
+        change = message_to_change(message)
         db.session.commit()
+        sessions.release()
+        publish_message_change(change)
         return jsonify({"message": "Message sent successfully"}), 201
     except Exception as e:
         db.session.rollback()
@@ -406,7 +1054,414 @@ def send_message():
         return jsonify({"error": "Failed to send message"}), 500
 
 
+def get_own_message(data, user_id):
+    message_id = data.get("message_id")
+    if not message_id:
+        return None, (jsonify({"error": "Missing message id"}), 400)
+
+    message = db.session.get(Message, message_id)
+    if not message or message.deleted_at:
+        return None, (jsonify({"error": "Message not found"}), 404)
+    if message.user_id != user_id:
+        return None, (jsonify({"error": "Not allowed"}), 403)
+
+    return message, None
+
+
+@app.route("/messages/edit", methods=["POST"])
+def edit_message():
+    try:
+        data = request.json
+        user_id = get_user_id_from_request()
+
+        if not user_id:
+            return jsonify({"error": "Authentication required"}), 401
+        if not data or not data.get("text"):
+            return jsonify({"error": "Missing message text"}), 400
+
+        message, error = get_own_message(data, user_id)
+        if error:
+            return error
+
+        message.text = data["text"]
+        message.edited_at = datetime.utcnow()
+        message.seq = next_room_seq(message.group_room_number)
+        update_room_preview(message)
+        change = message_to_change(message)
+        db.session.commit()
+        sessions.release()
+        publish_message_change(change)
+        return jsonify(change), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error occurred in /messages/edit route: {e}", exc_info=True)
+        return jsonify({"error": "Failed to edit message"}), 500
+
+
+@app.route("/messages/delete", methods=["POST"])
+def delete_message():
+    try:
+        data = request.json
+        user_id = get_user_id_from_request()
+
+        if not user_id:
+            return jsonify({"error": "Authentication required"}), 401
+        if not data:
+            return jsonify({"error": "Missing request data"}), 400
+
+        message, error = get_own_message(data, user_id)
+        if error:
+            return error
+
+        # The row stays behind as a tombstone until compact_tombstones runs.
+        message.text = ""
+        message.deleted_at = datetime.utcnow()
+        message.seq = next_room_seq(message.group_room_number)
+        update_room_preview(message)
+        record_message_deleted(message)
+        change = message_to_change(message)
+        db.session.commit()
+        sessions.release()
+        publish_message_change(change)
+        return jsonify(change), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error occurred in /messages/delete route: {e}", exc_info=True)
+        return jsonify({"error": "Failed to delete message"}), 500
+
+
+@app.route("/messages/changes", methods=["GET"])
+@sessions.read_only
+def get_message_changes():
+    user_id = get_user_id_from_request()
+    group_room_number = request.args.get("group_room_number")
+    since = request.args.get("since", 0, type=int)
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    if not group_room_number:
+        return jsonify({"error": "Missing group room number"}), 400
+
+    room = db.session.get(Room, group_room_number)
+    if not room:
+        return jsonify({"seq": 0, "reset": False, "changes": []}), 200
+
+    if since < room.compacted_seq:
+        # Tombstones the client has not seen are gone; it must reload.
+        return jsonify({"seq": room.last_seq, "reset": True, "changes": []}), 200
+
+    changes = (
+        Message.query.join(User)
+        .filter(
+            Message.group_room_number == group_room_number,
+            Message.seq > since,
+        )
+        .options(db.contains_eager(Message.user))
+        .order_by(Message.seq.asc())
+        .all()
+    )
+    change_data = []
+    for message in changes:
+        change = message_to_change(message)
+        if change["op"] != "delete":
+            change["is_current_user"] = message.user_id == user_id
+        change_data.append(change)
+    last_seq = room.last_seq
+    sessions.release()
+
+    return (
+        jsonify({"seq": last_seq, "reset": False, "changes": change_data}),
+        200,
+    )
+
+
+@app.route("/read_state/mark_read", methods=["POST"])
+def mark_read():
+    data = request.json
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    if not isinstance(data, dict):
+        return jsonify({"error": "Missing request data"}), 400
+    group_room_number = data.get("group_room_number")
+    if not group_room_number or not isinstance(group_room_number, str):
+        return jsonify({"error": "Missing group room number"}), 400
+
+    message_id = data.get("message_id")
+    if isinstance(message_id, str) and message_id.isdigit():
+        message_id = int(message_id)
+    if not isinstance(message_id, int) or isinstance(message_id, bool):
+        return jsonify({"error": "Missing message id"}), 400
+
+    if not db.session.get(RoomMember, (user_id, group_room_number)):
+        sessions.release()
+        return jsonify({"error": "Not a member of this room"}), 403
+    is_valid = is_valid_read_marker(user_id, group_room_number, message_id)
+    sessions.release()
+    if not is_valid:
+        return jsonify({"error": "Message not found in this room"}), 400
+
+    read_marker_buffer.mark(user_id, group_room_number, message_id)
+    ephemeral_hub.publish(
+        group_room_number, user_id, "read", {"message_id": message_id}
+    )
+    return jsonify({"message": "Marked as read"}), 202
+
+
+@app.route("/read_state/unread", methods=["GET"])
+def get_unread_counts():
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    # The caller's own pending markers are written first so the counts
+    # reflect what they just read.
+    markers = read_marker_buffer.drain(user_id)
+    if markers:
+        flush_read_markers(markers)
+
+    read_states = ReadState.query.filter(ReadState.user_id == user_id).all()
+    unread_data = {
+        read_state.group_room_number: {
+            "unread_count": read_state.unread_count,
+            "last_read_message_id": read_state.last_read_message_id,
+        }
+        for read_state in read_states
+    }
+    return jsonify(unread_data), 200
+
+
+@app.route("/attachments", methods=["POST"])
+def upload_attachment():
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    if request.content_length and request.content_length > MAX_ATTACHMENT_SIZE:
+        return jsonify({"error": "Attachment is too large"}), 413
+
+    # The raw body is the file. Reading request.stream in chunks keeps memory
+    # flat; request.files/request.json would buffer the whole upload.
+    content_type = request.mimetype or "application/octet-stream"
+    # Header values are latin-1, so clients percent-encode the filename.
+    filename = unquote(
+        request.headers.get("X-Filename") or request.args.get("filename") or ""
+    )
+    try:
+        sha256, size = attachment_store.save_stream(
+            request.stream, max_size=MAX_ATTACHMENT_SIZE
+        )
+    except AttachmentTooLarge:
+        return jsonify({"error": "Attachment is too large"}), 413
+
+    try:
+        attachment = Attachment(
+            sha256=sha256,
+            size=size,
+            content_type=content_type,
+            filename=filename or None,
+            user_id=user_id,
+        )
+        db.session.add(attachment)
+        db.session.flush()
+        attachment_data = attachment_to_dict(attachment)
+        db.session.commit()
+        sessions.release()
+        thumbnail_worker.submit(sha256, content_type)
+        return jsonify(attachment_data), 201
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error occurred in /attachments route: {e}", exc_info=True)
+        return jsonify({"error": "Failed to upload attachment"}), 500
+
+
+def get_downloadable_attachment(attachment_id):
+    # <img> tags cannot send an Authorization header, so a ?user_token= works
+    # as well, like /messages.
+    user_id = get_user_id_from_request() or get_current_user_id(
+        request.args.get("user_token")
+    )
+    if not user_id:
+        return None, (jsonify({"error": "Authentication required"}), 401)
+
+    # Ids are sequential, so anything the caller may not see is reported as
+    # missing rather than forbidden.
+    attachment = db.session.get(Attachment, attachment_id)
+    if not attachment or not can_read_attachment(user_id, attachment):
+        return None, (jsonify({"error": "Attachment not found"}), 404)
+    if not attachment_store.exists(attachment.sha256):
+        return None, (jsonify({"error": "Attachment not found"}), 404)
+
+    return attachment, None
+
+
+def can_read_attachment(user_id, attachment):
+    """The uploader, or a member of a room where it was posted."""
+    if attachment.user_id == user_id:
+        return True
+    posted_in_member_room = (
+        db.session.query(Message.id)
+        .join(
+            RoomMember,
+            (RoomMember.group_room_number == Message.group_room_number)
+            & (RoomMember.user_id == user_id),
+        )
+        .filter(Message.attachment_id == attachment.id, Message.deleted_at.is_(None))
+        .first()
+    )
+    return posted_in_member_room is not None
+
+
+@app.route("/attachments/<int:attachment_id>", methods=["GET"])
+@sessions.read_only
+def download_attachment(attachment_id):
+    attachment, error = get_downloadable_attachment(attachment_id)
+    if error:
+        return error
+
+    inline = attachment.content_type in INLINE_CONTENT_TYPES
+    # conditional=True answers Range/If-None-Match requests; a plain GET is
+    # handed to the server's wsgi.file_wrapper, which uses sendfile.
+    response = send_file(
+        attachment_store.path(attachment.sha256),
+        mimetype=attachment.content_type if inline else "application/octet-stream",
+        as_attachment=not inline,
+        download_name=attachment.filename or attachment.sha256,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=31536000,
+    )
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
+
+@app.route("/attachments/<int:attachment_id>/thumbnail", methods=["GET"])
+@sessions.read_only
+def download_attachment_thumbnail(attachment_id):
+    attachment, error = get_downloadable_attachment(attachment_id)
+    if error:
+        return error
+
+    thumbnail_path = attachment_store.thumbnail_path(attachment.sha256)
+    if not os.path.exists(thumbnail_path):
+        return jsonify({"error": "Thumbnail not available"}), 404
+
+    response = send_file(
+        thumbnail_path,
+        mimetype="image/jpeg",
+        conditional=True,
+        etag=attachment.sha256 + "-thumb",
+        max_age=31536000,
+    )
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
+
+@app.route("/rooms", methods=["GET"])
+@sessions.read_only
+def get_my_rooms():
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    # One row per room the user belongs to; the previews and unread counts
+    # are stored on rooms/read_states, so this never touches messages.
+    rows = (
+        db.session.query(Room, ReadState.unread_count)
+        .join(RoomMember, RoomMember.group_room_number == Room.group_room_number)
+        .outerjoin(
+            ReadState,
+            (ReadState.group_room_number == Room.group_room_number)
+            & (ReadState.user_id == user_id),
+        )
+        .filter(RoomMember.user_id == user_id)
+        .order_by(db.nullslast(Room.last_message_at.desc()))
+        .all()
+    )
+    room_data = [
+        dict(room_to_dict(room), unread_count=unread_count or 0)
+        for room, unread_count in rows
+    ]
+    sessions.release()
+    return jsonify(room_data), 200
+
+
+@app.route("/rooms/join", methods=["POST"])
+def join_chat_room():
+    data = request.json or {}
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    # Rooms are open: anyone signed in can join, like the built-in lobbies.
+    group_room_number = data.get("group_room_number")
+    if not group_room_number:
+        return jsonify({"error": "Missing group room number"}), 400
+
+    try:
+        room = get_or_create_room(group_room_number)
+        if data.get("name") and not room.name:
+            room.name = data["name"]
+        ensure_room_member(user_id, group_room_number)
+        room_data = room_to_dict(room)
+        db.session.commit()
+        sessions.release()
+        return jsonify(room_data), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error occurred in /rooms/join route: {e}", exc_info=True)
+        return jsonify({"error": "Failed to join room"}), 500
+
+
+@app.route("/rooms/leave", methods=["POST"])
+def leave_chat_room():
+    data = request.json or {}
+    user_id = get_user_id_from_request()
+
+    if not user_id:
+        return jsonify({"error": "Authentication required"}), 401
+
+    group_room_number = data.get("group_room_number")
+    if not group_room_number or not isinstance(group_room_number, str):
+        return jsonify({"error": "Missing group room number"}), 400
+
+    try:
+        # The read state goes with the membership, so the room drops out of
+        # /read_state/unread and a later rejoin starts from a fresh marker.
+        for model in (RoomMember, ReadState):
+            model.query.filter(
+                model.user_id == user_id,
+                model.group_room_number == group_room_number,
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        sessions.release()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error occurred in /rooms/leave route: {e}", exc_info=True)
+        return jsonify({"error": "Failed to leave room"}), 500
+
+    # Membership is only checked on join_room, so sockets that are already
+    # subscribed have to be dropped here or they keep receiving the room.
+    for sid, session in list(socket_sessions.items()):
+        if session["user_id"] == user_id and group_room_number in session["rooms"]:
+            unsubscribe_socket(sid, group_room_number)
+    return jsonify({"message": "Left room"}), 200
+
+
+@app.route("/delivery/stats", methods=["GET"])
+def get_delivery_stats():
+    if not get_user_id_from_request():
+        return jsonify({"error": "Authentication required"}), 401
+
+    return jsonify(delivery.stats()), 200
+
+
 @app.route("/messages", methods=["GET"])
+@sessions.read_only
 def get_messages():
     user_token = request.args.get("user_token")
     group_room_number = request.args.get("group_room_number")
@@ -438,12 +1493,14 @@ def get_messages():
             "timestamp": message.timestamp,
             "is_current_user": message.user_id == user_id,
         }
+        sessions.release()
         return jsonify(message_data), 200
     else:
         return jsonify({"message": "No messages found"}), 200
 
 
 @app.route("/search", methods=["GET"])
+@sessions.read_only
 def filter_search_terms():
     user_token = request.headers.get("Authorization")
     group_room_number = request.args.get("group_room_number")
@@ -458,6 +1515,7 @@ def filter_search_terms():
             (
                 Message.query.filter(
                     Message.group_room_number == group_room_number,
+                    Message.deleted_at.is_(None),
                     Message.text.ilike(f"%{search_term}%"),
                 )
             )
@@ -465,7 +1523,7 @@ def filter_search_terms():
             .all()
         )
 
-        print("search_Term_Results: ", search_Term_Results)
+        print("search_Term_Results: ", len(search_Term_Results))
 
         if search_Term_Results:
             search_Term_Results_Data = [
@@ -477,6 +1535,7 @@ def filter_search_terms():
                 }
                 for result in search_Term_Results
             ]
+            sessions.release()
 
             return jsonify(search_Term_Results_Data), 200
         else:
@@ -484,6 +1543,7 @@ def filter_search_terms():
 
 
 @app.route("/messages/all", methods=["GET"])
+@sessions.read_only
 def get_all_messages():
     user_token = request.headers.get("Authorization")
     if user_token:
@@ -498,17 +1558,27 @@ def get_all_messages():
         return jsonify({"error": "Authentication required"}), 401
 
     if group_room_number:
-        messages = (
-            Message.query.join(User)
-            .filter(Message.group_room_number == group_room_number)
-            .order_by(Message.timestamp.asc())
-            .all()
-        )
-    else:
-        messages = Message.query.join(User).order_by(Message.timestamp.asc()).all()
+        room_seq, messages = get_room_messages(group_room_number)
+        sessions.release()
+        message_data = [
+            dict(message, is_current_user=message["user_id"] == user_id)
+            for message in messages
+        ]
+        response = jsonify(message_data)
+        # Clients pass this back as ?since= to /messages/changes.
+        response.headers["X-Room-Seq"] = str(room_seq)
+        return response, 200
+
+    messages = (
+        Message.query.join(User)
+        .filter(Message.deleted_at.is_(None))
+        .options(db.contains_eager(Message.user))
+        .order_by(Message.timestamp.asc())
+        .all()
+    )
     print("group_room_number msg/all: ", group_room_number)
 
-    print("Messages:", messages)
+    print("Messages:", len(messages))
 
     message_data = []
     for message in messages:
@@ -519,11 +1589,20 @@ def get_all_messages():
                 "username": message.user.username,
                 "text": message.text,
                 "timestamp": message.timestamp,
+                "edited_at": message.edited_at,
+                "attachment": (
+                    attachment_to_dict(message.attachment)
+                    if message.attachment
+                    else None
+                ),
                 "group_room_number": message.group_room_number,
                 "is_current_user": message.user_id == user_id,
             }
         )
-    print("message_data msg/all", message_data)
+    # Everything is copied out of the ORM objects; give the connection back
+    # before the list is serialized.
+    sessions.release()
+    print("message_data msg/all", len(message_data))
     return jsonify(message_data), 200
 
 
@@ -549,6 +1628,11 @@ def catch_all(path):
             return f"An error occurred: {str(e)}", 500
 
 
+# Tests and one-off CLI commands set BACKGROUND_TASKS=0.
+if os.environ.get("BACKGROUND_TASKS", "1") != "0":
+    start_background_tasks()
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+
+def _without_op(change):
+    return {key: value for key, value in change.items() if key != "op"}
+
+
+class RoomMessageCache:
+    """Keeps the live messages of recently read rooms in memory.
+
+    Each room remembers the change sequence it was last synced to, so a
+    reader only has to fetch "changes since seq N" from the database
+    instead of reloading the whole history. Changes are applied by message
+    id and guarded by the per-message seq, which makes them idempotent.
+    """
+
+    def __init__(self, max_rooms=64):
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, group_room_number):
+        with self._lock:
+            room = self._rooms.get(group_room_number)
+            if room is None:
+                return None
+            self._rooms.move_to_end(group_room_number)
+            return room["seq"], list(room["messages"].values())
+
+    def seq(self, group_room_number):
+        with self._lock:
+            room = self._rooms.get(group_room_number)
+            return room["seq"] if room else None
+
+    def load(self, group_room_number, seq, messages):
+        with self._lock:
+            self._rooms[group_room_number] = {
+                "seq": seq,
+                "messages": OrderedDict(
+                    (message["id"], _without_op(message)) for message in messages
+                ),
+            }
+            self._rooms.move_to_end(group_room_number)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+
+    def apply(self, group_room_number, changes, seq=None):
+        """Apply change dicts (as built by ``message_to_change``).
+
+        ``seq`` is the sequence the changes bring the room up to. When it is
+        not given the room's seq only advances if the changes are contiguous
+        with what is cached; otherwise the gap is fetched on the next read.
+        """
+        with self._lock:
+            room = self._rooms.get(group_room_number)
+            if room is None:
+                return
+            messages = room["messages"]
+            for change in changes:
+                if seq is None and change["seq"] == room["seq"] + 1:
+                    room["seq"] = change["seq"]
+                current = messages.get(change["id"])
+                if current is not None and current["seq"] >= change["seq"]:
+                    continue
+                if change["op"] == "delete":
+                    messages.pop(change["id"], None)
+                else:
+                    messages[change["id"]] = _without_op(change)
+            if seq is not None and seq > room["seq"]:
+                room["seq"] = seq
+
+    def invalidate(self, group_room_number=None):
+        with self._lock:
+            if group_room_number is None:
+                self._rooms.clear()
+            else:
+                self._rooms.pop(group_room_number, None)
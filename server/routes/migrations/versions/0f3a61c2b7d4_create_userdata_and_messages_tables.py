@@ -0,0 +1,46 @@
+"""Create userdata and messages tables
+
+Revision ID: 0f3a61c2b7d4
+Revises: 
+Create Date: 2026-10-19 17:41:05.662918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0f3a61c2b7d4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The tables as they were before the first migration, which alters
+    # them, so a fresh database can be built with `db upgrade` alone.
+    # Databases already at 52fc49033d3d or later never run this.
+    op.create_table('userdata',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.VARCHAR(length=80), nullable=False),
+    sa.Column('email', sa.VARCHAR(length=120), nullable=False),
+    sa.Column('username', sa.VARCHAR(length=80), nullable=False),
+    sa.Column('password', sa.VARCHAR(length=120), nullable=False),
+    sa.Column('birthdate', sa.DATE(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['userdata.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('messages')
+    op.drop_table('userdata')
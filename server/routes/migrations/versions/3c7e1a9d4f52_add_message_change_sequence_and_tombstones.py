@@ -0,0 +1,48 @@
+"""Add message change sequence and tombstones
+
+Revision ID: 3c7e1a9d4f52
+Revises: b198395bae8d
+Create Date: 2026-10-19 09:12:44.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7e1a9d4f52'
+down_revision = 'b198395bae8d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('room_sequences',
+    sa.Column('group_room_number', sa.String(length=20), nullable=False),
+    sa.Column('last_seq', sa.BigInteger(), nullable=False),
+    sa.Column('compacted_seq', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('group_room_number')
+    )
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.BigInteger(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('edited_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_messages_room_seq', ['group_room_number', 'seq'], unique=False)
+
+    # Existing ids already increase within every room, so they make a valid
+    # starting sequence.
+    op.execute("UPDATE messages SET seq = id")
+    op.execute(
+        "INSERT INTO room_sequences (group_room_number, last_seq, compacted_seq) "
+        "SELECT group_room_number, MAX(seq), 0 FROM messages GROUP BY group_room_number"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_room_seq')
+        batch_op.drop_column('deleted_at')
+        batch_op.drop_column('edited_at')
+        batch_op.drop_column('seq')
+
+    op.drop_table('room_sequences')
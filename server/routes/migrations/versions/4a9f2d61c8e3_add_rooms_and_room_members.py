@@ -0,0 +1,103 @@
+"""Add rooms and room_members, make group_room_number a foreign key
+
+Revision ID: 4a9f2d61c8e3
+Revises: e52a0c9b7d18
+Create Date: 2026-10-19 16:48:09.227431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a9f2d61c8e3'
+down_revision = 'e52a0c9b7d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # room_sequences already has one row per room; it becomes the rooms table.
+    op.rename_table('room_sequences', 'rooms')
+    with op.batch_alter_table('rooms', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_user_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_text', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    op.execute(
+        "INSERT INTO rooms (group_room_number, last_seq, compacted_seq) "
+        "SELECT DISTINCT group_room_number, 0, 0 FROM "
+        "(SELECT group_room_number FROM messages "
+        "UNION SELECT group_room_number FROM read_states) AS known_rooms "
+        "WHERE group_room_number NOT IN (SELECT group_room_number FROM rooms)"
+    )
+    op.execute(
+        "UPDATE rooms SET last_message_id = (SELECT MAX(messages.id) FROM messages "
+        "WHERE messages.group_room_number = rooms.group_room_number "
+        "AND messages.deleted_at IS NULL)"
+    )
+    op.execute(
+        "UPDATE rooms SET "
+        "last_message_user_id = (SELECT user_id FROM messages "
+        "WHERE messages.id = rooms.last_message_id), "
+        "last_message_text = (SELECT SUBSTR(text, 1, 200) FROM messages "
+        "WHERE messages.id = rooms.last_message_id), "
+        "last_message_at = (SELECT timestamp FROM messages "
+        "WHERE messages.id = rooms.last_message_id), "
+        "created_at = (SELECT MIN(timestamp) FROM messages "
+        "WHERE messages.group_room_number = rooms.group_room_number)"
+    )
+
+    op.create_table('room_members',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('group_room_number', sa.String(length=20), nullable=False),
+    sa.Column('joined_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['group_room_number'], ['rooms.group_room_number'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['userdata.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'group_room_number')
+    )
+    with op.batch_alter_table('room_members', schema=None) as batch_op:
+        batch_op.create_index('ix_room_members_room', ['group_room_number'], unique=False)
+
+    # Everyone who has posted in or read a room is a member of it.
+    op.execute(
+        "INSERT INTO room_members (user_id, group_room_number, joined_at) "
+        "SELECT user_id, group_room_number, MIN(joined_at) FROM "
+        "(SELECT user_id, group_room_number, timestamp AS joined_at FROM messages "
+        "UNION ALL SELECT user_id, group_room_number, NULL FROM read_states) "
+        "AS memberships GROUP BY user_id, group_room_number"
+    )
+
+    # ix_messages_room_seq and ix_messages_room_id both lead with
+    # group_room_number, so the foreign key is already indexed.
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_messages_group_room_number', 'rooms', ['group_room_number'], ['group_room_number'])
+
+    with op.batch_alter_table('read_states', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_read_states_group_room_number', 'rooms', ['group_room_number'], ['group_room_number'])
+
+
+def downgrade():
+    with op.batch_alter_table('read_states', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_read_states_group_room_number', type_='foreignkey')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_messages_group_room_number', type_='foreignkey')
+
+    with op.batch_alter_table('room_members', schema=None) as batch_op:
+        batch_op.drop_index('ix_room_members_room')
+
+    op.drop_table('room_members')
+
+    with op.batch_alter_table('rooms', schema=None) as batch_op:
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('last_message_text')
+        batch_op.drop_column('last_message_user_id')
+        batch_op.drop_column('last_message_id')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('name')
+
+    op.rename_table('rooms', 'room_sequences')
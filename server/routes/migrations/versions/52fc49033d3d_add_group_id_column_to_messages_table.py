@@ -1,7 +1,7 @@
 """Add group_id column to messages table
 
 Revision ID: 52fc49033d3d
-Revises: 
+Revises: 0f3a61c2b7d4
 Create Date: 2024-05-01 06:18:37.263071
 
 """
@@ -12,7 +12,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = "52fc49033d3d"
-down_revision = None
+down_revision = "0f3a61c2b7d4"
 branch_labels = None
 depends_on = None
 
@@ -20,11 +20,12 @@ depends_on = None
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table("messages", schema=None) as batch_op:
-        op.add_column(
-            "messages",
+        # SQLite cannot add a NOT NULL column without a default.
+        batch_op.add_column(
             sa.Column(
                 "group_id",
                 sa.String(20),
+                server_default="default_group",
                 nullable=False,
             ),
         )
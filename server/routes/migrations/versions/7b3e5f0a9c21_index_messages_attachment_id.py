@@ -0,0 +1,27 @@
+"""Index messages.attachment_id
+
+Revision ID: 7b3e5f0a9c21
+Revises: 4a9f2d61c8e3
+Create Date: 2026-10-19 17:02:14.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e5f0a9c21'
+down_revision = '4a9f2d61c8e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Attachment downloads look up the messages that posted an attachment.
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_messages_attachment_id'), ['attachment_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_messages_attachment_id'))
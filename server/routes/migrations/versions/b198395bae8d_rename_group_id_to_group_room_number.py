@@ -17,18 +17,23 @@ depends_on = None
 
 
 def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
+    # Added nullable and filled from group_id first: a NOT NULL column with
+    # no default cannot be added to a table that has rows.
     with op.batch_alter_table('messages', schema=None) as batch_op:
-        batch_op.add_column(sa.Column('group_room_number', sa.String(length=20), nullable=False))
-        batch_op.drop_column('group_id')
+        batch_op.add_column(sa.Column('group_room_number', sa.String(length=20), nullable=True))
+
+    op.execute("UPDATE messages SET group_room_number = group_id")
 
-    # ### end Alembic commands ###
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.alter_column('group_room_number', existing_type=sa.String(length=20), nullable=False)
+        batch_op.drop_column('group_id')
 
 
 def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table('messages', schema=None) as batch_op:
-        batch_op.add_column(sa.Column('group_id', sa.VARCHAR(length=20), server_default=sa.text("'default_group'::character varying"), autoincrement=False, nullable=False))
-        batch_op.drop_column('group_room_number')
+        batch_op.add_column(sa.Column('group_id', sa.VARCHAR(length=20), server_default='default_group', autoincrement=False, nullable=False))
+
+    op.execute("UPDATE messages SET group_id = group_room_number")
 
-    # ### end Alembic commands ###
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('group_room_number')
@@ -0,0 +1,36 @@
+"""Seed read states for room members that have none
+
+Revision ID: c1d8a4e6f302
+Revises: 7b3e5f0a9c21
+Create Date: 2026-10-19 17:20:41.093517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1d8a4e6f302'
+down_revision = '7b3e5f0a9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Unread counts are only kept for existing read states, so every member
+    # needs one. Members without one start with the room read.
+    op.execute(
+        "INSERT INTO read_states "
+        "(user_id, group_room_number, last_read_message_id, unread_count) "
+        "SELECT room_members.user_id, room_members.group_room_number, "
+        "COALESCE(rooms.last_message_id, 0), 0 FROM room_members "
+        "JOIN rooms ON rooms.group_room_number = room_members.group_room_number "
+        "WHERE NOT EXISTS (SELECT 1 FROM read_states "
+        "WHERE read_states.user_id = room_members.user_id "
+        "AND read_states.group_room_number = room_members.group_room_number)"
+    )
+
+
+def downgrade():
+    # The seeded rows are indistinguishable from real ones; leave them.
+    pass
@@ -0,0 +1,39 @@
+import threading
+
+
+class ReadMarkerBuffer:
+    """Coalesces mark-read requests before they are written.
+
+    Clients mark a room read every time they scroll or receive a message;
+    only the highest message id per (user, room) matters, so requests are
+    merged here and written in one batch by the flush loop.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def mark(self, user_id, group_room_number, message_id):
+        key = (user_id, group_room_number)
+        with self._lock:
+            if message_id > self._pending.get(key, 0):
+                self._pending[key] = message_id
+
+    def drain(self, user_id=None):
+        """Remove and return pending markers, optionally for one user only."""
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+                return pending
+            pending = {
+                key: message_id
+                for key, message_id in self._pending.items()
+                if key[0] == user_id
+            }
+            for key in pending:
+                del self._pending[key]
+            return pending
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,57 @@
+import importlib
+import os
+
+import pytest
+
+# memory and sqlite always run; set TEST_DATABASE_URL to a scratch
+# PostgreSQL database to add the postgres profile to the matrix.
+PROFILES = ["memory", "sqlite"]
+if os.environ.get("TEST_DATABASE_URL"):
+    PROFILES.append("postgres")
+
+
+@pytest.fixture(scope="module", params=PROFILES)
+def main(request, tmp_path_factory):
+    os.environ["DATABASE_PROFILE"] = request.param
+    # The tests call compaction and read-marker writes directly.
+    os.environ["BACKGROUND_TASKS"] = "0"
+    os.environ["SQLITE_PATH"] = str(tmp_path_factory.mktemp("db") / "test.db")
+    os.environ["ATTACHMENT_STORAGE_PATH"] = str(tmp_path_factory.mktemp("blobs"))
+    if request.param == "postgres":
+        os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+
+    # main configures its app and engine at import time, so each profile
+    # gets a fresh copy of the module.
+    module = importlib.import_module("routes.main")
+    return importlib.reload(module)
+
+
+@pytest.fixture
+def client(main):
+    with main.app.app_context():
+        main.db.drop_all()
+        main.db.create_all()
+    main.room_message_cache.invalidate()
+    return main.app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    def register(username, password="Passw0rd!!x"):
+        client.post(
+            "/register",
+            json={
+                "name": username,
+                "email": f"{username}@gmail.com",
+                "username": username,
+                "password": password,
+                "birthdate": None,
+            },
+        )
+        response = client.post(
+            "/login", json={"username": username, "password": password}
+        )
+        token = response.json["user_token"]
+        return {"Authorization": f"Bearer {token}"}, token
+
+    return register
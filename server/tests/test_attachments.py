@@ -0,0 +1,131 @@
+"""Attachment uploads, downloads and the blob store."""
+
+import io
+import os
+import time
+
+import pytest
+
+from routes.attachments import AttachmentTooLarge, BlobStore
+
+
+def upload(client, headers, body, content_type="application/octet-stream"):
+    return client.post(
+        "/attachments",
+        data=body,
+        headers=dict(headers, **{"Content-Type": content_type, "X-Filename": "a.bin"}),
+    )
+
+
+def stored_blobs(root):
+    return [
+        name
+        for directory, _, names in os.walk(root)
+        if os.path.basename(directory) != "tmp"
+        for name in names
+        if not name.endswith(".jpg")
+    ]
+
+
+def test_blob_store_rejects_oversized_stream(tmp_path):
+    store = BlobStore(str(tmp_path))
+    with pytest.raises(AttachmentTooLarge):
+        store.save_stream(io.BytesIO(b"x" * 100), max_size=10, chunk_size=8)
+    # The partial temp file is cleaned up.
+    assert os.listdir(tmp_path / "tmp") == []
+    assert stored_blobs(str(tmp_path)) == []
+
+
+def test_upload_deduplicates_content(client, register, main):
+    headers, _ = register("alice")
+    first = upload(client, headers, b"same bytes")
+    second = upload(client, headers, b"same bytes")
+
+    assert first.status_code == second.status_code == 201
+    assert first.json["id"] != second.json["id"]
+    assert len(stored_blobs(main.attachment_store.root)) == 1
+
+
+def test_upload_too_large(client, register, main, monkeypatch):
+    headers, _ = register("alice")
+    monkeypatch.setattr(main, "MAX_ATTACHMENT_SIZE", 4)
+    assert upload(client, headers, b"too large").status_code == 413
+    assert client.post("/attachments", data=b"x").status_code == 401
+
+
+def test_range_download(client, register):
+    headers, _ = register("alice")
+    attachment = upload(client, headers, b"0123456789").json
+
+    response = client.get(
+        f"/attachments/{attachment['id']}", headers=dict(headers, Range="bytes=2-5")
+    )
+    assert response.status_code == 206
+    assert response.data == b"2345"
+    assert response.headers["Content-Range"] == "bytes 2-5/10"
+
+
+def test_thumbnail_is_generated(client, register):
+    from PIL import Image
+
+    headers, _ = register("alice")
+    image = io.BytesIO()
+    Image.new("RGB", (800, 600), "red").save(image, "PNG")
+    attachment = upload(client, headers, image.getvalue(), "image/png").json
+
+    # Thumbnails are made on a worker thread after the upload returns.
+    deadline = time.monotonic() + 5
+    while True:
+        response = client.get(
+            f"/attachments/{attachment['id']}/thumbnail", headers=headers
+        )
+        if response.status_code == 200 or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert Image.open(io.BytesIO(response.data)).size == (320, 240)
+
+
+def test_download_requires_uploader_or_room_member(client, register):
+    alice, alice_token = register("alice")
+    bobby, _ = register("bobby")
+    carol, _ = register("carol")
+    attachment = upload(client, alice, b"private").json
+    url = f"/attachments/{attachment['id']}"
+
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=alice).status_code == 200
+    # Not posted anywhere yet.
+    assert client.get(url, headers=bobby).status_code == 404
+
+    client.post(
+        "/messages/send",
+        json={
+            "user_token": alice_token,
+            "group_room_number": "Group1",
+            "text": "",
+            "attachment_id": attachment["id"],
+        },
+    )
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=bobby)
+    assert client.get(url, headers=bobby).status_code == 200
+    assert client.get(url, headers=carol).status_code == 404
+
+
+def test_only_raster_images_are_served_inline(client, register):
+    headers, _ = register("alice")
+    for content_type in ("text/html", "image/svg+xml"):
+        attachment = upload(client, headers, b"<script>alert(1)</script>", content_type)
+        response = client.get(f"/attachments/{attachment.json['id']}", headers=headers)
+        assert response.mimetype == "application/octet-stream"
+        assert response.headers["Content-Disposition"].startswith("attachment;")
+        assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+    attachment = upload(client, headers, b"not really a png", "image/png")
+    response = client.get(f"/attachments/{attachment.json['id']}", headers=headers)
+    assert response.mimetype == "image/png"
+    assert response.headers["Content-Disposition"].startswith("inline;")
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
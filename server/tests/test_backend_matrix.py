@@ -0,0 +1,348 @@
+"""Auth, messages and search paths, run against every database profile."""
+
+from datetime import timedelta
+
+
+def send(client, token, text, group_room_number="Group1"):
+    return client.post(
+        "/messages/send",
+        json={
+            "user_token": token,
+            "group_room_number": group_room_number,
+            "text": text,
+        },
+    )
+
+
+def test_register_and_login(client, register):
+    headers, token = register("alice")
+    assert token
+
+    duplicate = client.post(
+        "/register",
+        json={
+            "name": "alice",
+            "email": "alice@gmail.com",
+            "username": "alice",
+            "password": "Passw0rd!!x",
+            "birthdate": None,
+        },
+    )
+    assert duplicate.status_code == 400
+
+    wrong = client.post("/login", json={"username": "alice", "password": "nope"})
+    assert wrong.status_code == 401
+    missing = client.post("/login", json={"username": "nobody", "password": "x"})
+    assert missing.status_code == 404
+
+
+def test_messages_require_auth(client):
+    assert client.get("/messages/all?group_room_number=Group1").status_code == 401
+    assert send(client, None, "hi").status_code == 400
+
+
+def test_send_and_list_messages(client, register):
+    headers, token = register("alice")
+    assert send(client, token, "hello").status_code == 201
+    assert send(client, token, "again").status_code == 201
+    assert send(client, token, "elsewhere", "Group2").status_code == 201
+
+    response = client.get("/messages/all?group_room_number=Group1", headers=headers)
+    assert [m["text"] for m in response.json] == ["hello", "again"]
+    assert response.headers["X-Room-Seq"] == "2"
+    assert all(m["is_current_user"] for m in response.json)
+
+    latest = client.get(
+        "/messages",
+        query_string={"user_token": token, "group_room_number": "Group1"},
+    )
+    assert latest.json["text"] == "again"
+
+
+def test_edit_delete_and_changes(client, register):
+    headers, token = register("alice")
+    other_headers, _ = register("bobby")
+    send(client, token, "first")
+    send(client, token, "second")
+    first, second = client.get(
+        "/messages/all?group_room_number=Group1", headers=headers
+    ).json
+
+    forbidden = client.post(
+        "/messages/edit",
+        json={"message_id": first["id"], "text": "nope"},
+        headers=other_headers,
+    )
+    assert forbidden.status_code == 403
+
+    edited = client.post(
+        "/messages/edit",
+        json={"message_id": first["id"], "text": "first, edited"},
+        headers=headers,
+    )
+    assert edited.json["op"] == "edit"
+    deleted = client.post(
+        "/messages/delete", json={"message_id": second["id"]}, headers=headers
+    )
+    assert deleted.json["op"] == "delete"
+
+    changes = client.get(
+        "/messages/changes?group_room_number=Group1&since=2", headers=headers
+    ).json
+    assert changes["seq"] == 4
+    assert [(c["id"], c["op"]) for c in changes["changes"]] == [
+        (first["id"], "edit"),
+        (second["id"], "delete"),
+    ]
+
+    # Served from the room cache, which must have picked up both changes.
+    listed = client.get("/messages/all?group_room_number=Group1", headers=headers)
+    assert [m["text"] for m in listed.json] == ["first, edited"]
+
+
+def test_send_requires_text_or_attachment(client, register):
+    _, token = register("alice")
+    assert send(client, token, "").status_code == 400
+    assert send(client, token, None).status_code == 400
+    assert send(client, token, {"text": "hi"}).status_code == 400
+
+    for attachment_id, status in (("abc", 400), (True, 400), (999, 404)):
+        response = client.post(
+            "/messages/send",
+            json={
+                "user_token": token,
+                "group_room_number": "Group1",
+                "attachment_id": attachment_id,
+            },
+        )
+        assert response.status_code == status
+
+
+def test_compacted_tombstones_reset_stale_clients(client, register, main):
+    headers, token = register("alice")
+    send(client, token, "kept")
+    send(client, token, "deleted")
+    kept, deleted = client.get(
+        "/messages/all?group_room_number=Group1", headers=headers
+    ).json
+    client.post("/messages/delete", json={"message_id": deleted["id"]}, headers=headers)
+
+    # A cache that predates the compaction must be reloaded, not patched.
+    main.room_message_cache.load("Group1", 1, [dict(kept, op="create", seq=1)])
+    with main.app.app_context():
+        assert main.compact_tombstones(retention=timedelta(0)) == 1
+        assert main.compact_tombstones(retention=timedelta(0)) == 0
+
+    stale = client.get(
+        "/messages/changes?group_room_number=Group1&since=0", headers=headers
+    ).json
+    assert stale == {"seq": 3, "reset": True, "changes": []}
+    current = client.get(
+        "/messages/changes?group_room_number=Group1&since=3", headers=headers
+    ).json
+    assert current == {"seq": 3, "reset": False, "changes": []}
+
+    listed = client.get("/messages/all?group_room_number=Group1", headers=headers)
+    assert [m["id"] for m in listed.json] == [kept["id"]]
+    assert listed.headers["X-Room-Seq"] == "3"
+
+
+def test_unread_counts_and_rooms(client, register, main):
+    alice, alice_token = register("alice")
+    bobby, bobby_token = register("bobby")
+    send(client, alice_token, "hello")
+    send(client, bobby_token, "hi alice")
+    send(client, bobby_token, "are you there?")
+
+    unread = client.get("/read_state/unread", headers=alice).json
+    assert unread["Group1"]["unread_count"] == 2
+
+    last_id = client.get(
+        "/messages/all?group_room_number=Group1", headers=alice
+    ).json[-1]["id"]
+    client.post(
+        "/read_state/mark_read",
+        json={"group_room_number": "Group1", "message_id": last_id},
+        headers=alice,
+    )
+    unread = client.get("/read_state/unread", headers=alice).json
+    assert unread["Group1"]["unread_count"] == 0
+
+    rooms = client.get("/rooms", headers=alice).json
+    assert rooms[0]["group_room_number"] == "Group1"
+    assert rooms[0]["last_message"]["text"] == "are you there?"
+
+
+def test_mark_read_is_validated(client, register, main, monkeypatch):
+    alice, alice_token = register("alice")
+    bobby, bobby_token = register("bobby")
+    carol, _ = register("carol")
+    send(client, alice_token, "hello")
+    send(client, bobby_token, "hi")
+    send(client, alice_token, "elsewhere", "Group2")
+    messages = client.get("/messages/all?group_room_number=Group1", headers=alice)
+    first_id, last_id = [m["id"] for m in messages.json]
+    other_room_id = client.get(
+        "/messages/all?group_room_number=Group2", headers=alice
+    ).json[0]["id"]
+
+    def mark_read(headers, group_room_number, message_id):
+        return client.post(
+            "/read_state/mark_read",
+            json={"group_room_number": group_room_number, "message_id": message_id},
+            headers=headers,
+        )
+
+    published = main.ephemeral_hub.published
+    assert mark_read(carol, "Group1", last_id).status_code == 403
+    assert mark_read(alice, ["Group1"], last_id).status_code == 400
+    for bad_id in (10**20, 2**31 + 5, -1, other_room_id, True, "abc"):
+        assert mark_read(alice, "Group1", bad_id).status_code == 400
+    assert main.ephemeral_hub.published == published
+    assert client.get("/read_state/unread", headers=carol).json == {}
+
+    assert mark_read(alice, "Group1", last_id).status_code == 202
+    assert client.get("/read_state/unread", headers=alice).json["Group1"] == {
+        "unread_count": 0,
+        "last_read_message_id": last_id,
+    }
+
+    # Markers that stopped being valid in the buffer are dropped on flush
+    # without holding back the others.
+    with main.app.app_context():
+        main.flush_read_markers(
+            {(1, "Group1"): 10**20, (2, "Group1"): first_id, (3, "Group1"): last_id}
+        )
+    assert client.get("/read_state/unread", headers=carol).json == {}
+    assert client.get("/read_state/unread", headers=bobby).json["Group1"][
+        "last_read_message_id"
+    ] == last_id
+
+    # A marker that makes the batch fail is dropped; the rest still land.
+    is_valid_read_marker = main.is_valid_read_marker
+
+    def fail_for_alice(user_id, *args):
+        if user_id == 1:
+            raise OverflowError("bad marker")
+        return is_valid_read_marker(user_id, *args)
+
+    monkeypatch.setattr(main, "is_valid_read_marker", fail_for_alice)
+    send(client, alice_token, "one more")
+    newest_id = client.get(
+        "/messages/all?group_room_number=Group1", headers=bobby
+    ).json[-1]["id"]
+    with main.app.app_context():
+        main.flush_read_markers({(1, "Group1"): last_id, (2, "Group1"): newest_id})
+    assert client.get("/read_state/unread", headers=bobby).json["Group1"] == {
+        "unread_count": 0,
+        "last_read_message_id": newest_id,
+    }
+
+
+def test_joined_members_get_unread_counts(client, register):
+    alice, alice_token = register("alice")
+    bobby, _ = register("bobby")
+    send(client, alice_token, "before bobby joined")
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=bobby)
+    for text in ("one", "two", "three"):
+        send(client, alice_token, text)
+
+    rooms = client.get("/rooms", headers=bobby).json
+    assert rooms[0]["unread_count"] == 3
+    unread = client.get("/read_state/unread", headers=bobby).json
+    assert unread["Group1"]["unread_count"] == 3
+
+
+def test_leave_room_drops_read_state_and_socket(client, register, main):
+    alice, alice_token = register("alice")
+    bobby, bobby_token = register("bobby")
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=bobby)
+    socket = main.socketio.test_client(main.app, flask_test_client=client)
+    socket.emit("join_room", {"group_room_number": "Group1", "user_token": bobby_token})
+    send(client, alice_token, "hello")
+    assert main.delivery.stats()["rooms"] == 1
+
+    assert client.post("/rooms/leave", json={}, headers=bobby).status_code == 400
+    response = client.post(
+        "/rooms/leave", json={"group_room_number": "Group1"}, headers=bobby
+    )
+    assert response.status_code == 200
+    assert client.get("/rooms", headers=bobby).json == []
+    assert "Group1" not in client.get("/read_state/unread", headers=bobby).json
+    assert main.delivery.stats()["rooms"] == 0
+
+    # Rejoining starts from what the room has now, not from the old marker.
+    send(client, alice_token, "while bobby was away")
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=bobby)
+    unread = client.get("/read_state/unread", headers=bobby).json
+    assert unread["Group1"]["unread_count"] == 0
+    socket.disconnect()
+
+
+def test_search(client, register):
+    headers, token = register("alice")
+    send(client, token, "Hello World")
+    send(client, token, "goodbye")
+    send(client, token, "hello from another room", "Group2")
+
+    response = client.get(
+        "/search",
+        query_string={"group_room_number": "Group1", "term": "hello"},
+        headers=headers,
+    )
+    assert [r["text"] for r in response.json] == ["Hello World"]
+
+    client.post(
+        "/messages/delete", json={"message_id": response.json[0]["id"]}, headers=headers
+    )
+    response = client.get(
+        "/search",
+        query_string={"group_room_number": "Group1", "term": "hello"},
+        headers=headers,
+    )
+    assert response.json == {"search_term_results": "no results found"}
+
+
+def test_socket_join_requires_token_and_membership(client, register, main):
+    headers, token = register("alice")
+    socket = main.socketio.test_client(main.app, flask_test_client=client)
+
+    socket.emit("join_room", {"group_room_number": "Group1"})
+    socket.emit("join_room", {"group_room_number": "Group1", "user_token": "bad"})
+    socket.emit("join_room", {"group_room_number": "Group1", "user_token": token})
+    assert main.delivery.stats()["rooms"] == 0
+
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=headers)
+
+    socket.emit("join_room", {"group_room_number": "Group1", "user_token": token})
+    assert main.delivery.stats()["rooms"] == 1
+    socket.disconnect()
+    assert main.delivery.stats()["rooms"] == 0
+
+
+def test_socket_ephemeral_payload_shapes(client, register, main):
+    headers, token = register("alice")
+    client.post("/rooms/join", json={"group_room_number": "Group1"}, headers=headers)
+    socket = main.socketio.test_client(main.app, flask_test_client=client)
+    socket.emit("join_room", {"group_room_number": "Group1", "user_token": token})
+    published = main.ephemeral_hub.published
+
+    for event in [
+        {"type": "typing", "payload": {"typing": "x" * 100000}},
+        {"type": "typing", "payload": {"typing": True, "extra": 1}},
+        {"type": "typing", "payload": "typing"},
+        {"type": "presence", "payload": {"online": True}},
+        {"type": "typing", "payload": {"typing": True}, "group_room_number": "Group2"},
+        "typing",
+    ]:
+        if isinstance(event, dict):
+            event.setdefault("group_room_number", "Group1")
+        socket.emit("ephemeral", event)
+    assert main.ephemeral_hub.published == published
+
+    socket.emit(
+        "ephemeral",
+        {"type": "typing", "group_room_number": "Group1", "payload": {"typing": True}},
+    )
+    assert main.ephemeral_hub.published == published + 1
+    socket.disconnect()
@@ -0,0 +1,101 @@
+"""SessionManager and the per-request DB profile."""
+
+import logging
+
+import pytest
+from flask import Flask, jsonify
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import StaticPool
+
+from routes.db_session import SessionManager, install_request_profiling
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "connect_args": {"check_same_thread": False},
+        "poolclass": StaticPool,
+    }
+    install_request_profiling(
+        app, slow_transaction_ms=1000, slow_connection_hold_ms=1000, max_rows_fetched=2
+    )
+    db = SQLAlchemy(app)
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    sessions = SessionManager(db)
+
+    @app.route("/items/<int:count>")
+    @sessions.read_only
+    def list_items(count):
+        ids = [item.id for item in Item.query.limit(count).all()]
+        return jsonify(ids)
+
+    @app.route("/fail")
+    @sessions.read_only
+    def fail():
+        Item.query.all()
+        raise RuntimeError("view failed")
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Item() for _ in range(5)])
+        db.session.commit()
+
+    app.extensions["test_db"] = db
+    return app
+
+
+def test_read_only_closes_the_session(app):
+    db = app.extensions["test_db"]
+    list_items = app.view_functions["list_items"]
+    with app.test_request_context():
+        # Undecorated, the view leaves its transaction open.
+        list_items.__wrapped__(3)
+        assert db.session().in_transaction()
+        db.session.close()
+
+        list_items(3)
+        assert not db.session().in_transaction()
+
+        with pytest.raises(RuntimeError):
+            app.view_functions["fail"]()
+        assert not db.session().in_transaction()
+
+
+def test_many_rows_fetched_is_logged_as_warning(app, caplog):
+    client = app.test_client()
+
+    with caplog.at_level(logging.DEBUG):
+        assert client.get("/items/2").json == [1, 2]
+    assert not [r for r in caplog.records if r.levelno == logging.WARNING]
+
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG):
+        client.get("/items/5")
+    warnings = [r.getMessage() for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "many rows fetched" in warnings[0]
+    assert "'rows_fetched': 5" in warnings[0]
+
+
+def test_slow_transaction_is_logged_as_warning(caplog):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    install_request_profiling(app, slow_transaction_ms=0, slow_connection_hold_ms=0)
+    db = SQLAlchemy(app)
+
+    @app.route("/")
+    def index():
+        db.session.execute(db.text("SELECT 1"))
+        db.session.commit()
+        return "ok"
+
+    with caplog.at_level(logging.WARNING):
+        app.test_client().get("/")
+    [warning] = [r.getMessage() for r in caplog.records]
+    assert "slow transaction" in warning
+    assert "long connection hold" in warning
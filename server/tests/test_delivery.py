@@ -0,0 +1,182 @@
+"""DeliveryLayer queueing, slow consumer policies and sharding."""
+
+import pytest
+
+from routes.delivery import DISCONNECT, DeliveryLayer
+
+
+class FakeSocketServer:
+    def __init__(self):
+        self.encoded = 0
+        self.sent = []
+        self.disconnected = []
+        self.backlogs = {}
+
+    def encode(self, event, data):
+        self.encoded += 1
+        return f"{event}:{data}"
+
+    def send(self, sid, encoded):
+        self.sent.append((sid, encoded))
+
+    def received(self, sid):
+        return [encoded for to, encoded in self.sent if to == sid]
+
+
+@pytest.fixture
+def server():
+    return FakeSocketServer()
+
+
+def make_layer(server, **options):
+    options.setdefault("shards", 2)
+    options.setdefault("max_queue", 2)
+    options.setdefault("max_in_flight", 4)
+    return DeliveryLayer(
+        encode=server.encode,
+        send=server.send,
+        disconnect=server.disconnected.append,
+        spawn=lambda target, *args: None,
+        backlog=lambda sid: server.backlogs.get(sid, 0),
+        pump_interval=0,
+        **options,
+    )
+
+
+def pump(layer):
+    for shard in range(len(layer._inboxes)):
+        layer._pump(shard)
+
+
+def test_broadcast_is_encoded_once_for_every_subscriber(server):
+    layer = make_layer(server)
+    for sid in ("a", "b", "c"):
+        layer.subscribe(sid, "Group1")
+    layer.subscribe("d", "Group2")
+
+    layer.emit("message_changed", 1, to="Group1")
+    pump(layer)
+
+    assert server.encoded == 1
+    assert sorted(server.sent) == [(sid, "message_changed:1") for sid in "abc"]
+
+
+def test_backlogged_socket_is_retried_in_order(server):
+    layer = make_layer(server)
+    layer.subscribe("slow", "Group1")
+    server.backlogs["slow"] = 4
+
+    layer.emit("message_changed", 1, to="Group1")
+    layer.emit("message_changed", 2, to="Group1")
+    pump(layer)
+    assert server.sent == []
+    assert layer.stats()["queued"] == 2
+
+    server.backlogs["slow"] = 0
+    pump(layer)
+    assert server.received("slow") == ["message_changed:1", "message_changed:2"]
+    assert layer.stats()["queued"] == 0
+
+
+def test_drop_oldest_only_drops_ephemeral_packets(server):
+    layer = make_layer(server)
+    layer.subscribe("slow", "Group1")
+    layer.subscribe("fast", "Group1")
+    server.backlogs["slow"] = 4
+
+    layer.emit("ephemeral_batch", 1, to="Group1")
+    layer.emit("message_changed", 1, to="Group1")
+    layer.emit("message_changed", 2, to="Group1")
+    # Queue is full of durable packets; a new ephemeral one is dropped.
+    layer.emit("ephemeral_batch", 2, to="Group1")
+    pump(layer)
+    assert layer.stats()["dropped"] == 2
+    assert server.disconnected == []
+
+    server.backlogs["slow"] = 0
+    pump(layer)
+    assert server.received("slow") == ["message_changed:1", "message_changed:2"]
+    assert len(server.received("fast")) == 4
+
+
+def test_drop_oldest_disconnects_instead_of_dropping_durable_packets(server):
+    layer = make_layer(server)
+    layer.subscribe("slow", "Group1")
+    server.backlogs["slow"] = 4
+
+    for seq in range(3):
+        layer.emit("message_changed", seq, to="Group1")
+    pump(layer)
+
+    assert server.disconnected == ["slow"]
+    stats = layer.stats()
+    assert stats["connections"] == 0
+    assert stats["disconnected"] == 1
+    assert stats["dropped"] == 3
+
+
+def test_disconnect_policy(server):
+    layer = make_layer(server, policy=DISCONNECT)
+    layer.subscribe("slow", "Group1")
+    server.backlogs["slow"] = 4
+
+    for seq in range(3):
+        layer.emit("ephemeral_batch", seq, to="Group1")
+    pump(layer)
+
+    assert server.disconnected == ["slow"]
+
+
+def test_hot_room_does_not_hold_up_other_shards(server):
+    layer = make_layer(server, max_queue=1000, fan_out_batch=10)
+    rooms = [f"Group{number}" for number in range(1, 20)]
+    hot = rooms[0]
+    quiet = next(
+        room for room in rooms if layer._shard_for(room) != layer._shard_for(hot)
+    )
+    layer.subscribe("a", hot)
+    layer.subscribe("b", quiet)
+
+    for seq in range(100):
+        layer.emit("message_changed", seq, to=hot)
+    layer.emit("message_changed", "quiet", to=quiet)
+    layer._pump(layer._shard_for(quiet))
+
+    assert server.sent == [("b", "message_changed:quiet")]
+    assert layer.stats()["shard_backlog"][layer._shard_for(hot)] == 100
+
+
+def test_stats_do_not_expose_socket_ids(server):
+    layer = make_layer(server)
+    layer.subscribe("secret-sid", "Group1")
+    server.backlogs["secret-sid"] = 4
+    layer.emit("message_changed", 1, to="Group1")
+    pump(layer)
+
+    stats = layer.stats()
+    assert stats["deepest_queues"] == [1]
+    assert "secret-sid" not in str(stats)
+
+
+def test_socket_backlog_reads_engineio_queue(main):
+    # socket_backlog relies on engine.io internals; this fails if an upgrade
+    # moves them.
+    from engineio.socket import Socket
+
+    eio = main.socketio.server.eio
+    eio.sockets["eio-sid"] = Socket(eio, "eio-sid")
+    sid = main.socketio.server.manager.connect("eio-sid", "/")
+    try:
+        assert main.socket_backlog(sid) == 0
+        eio.sockets["eio-sid"].queue.put("packet")
+        assert main.socket_backlog(sid) == 1
+    finally:
+        main.socketio.server.manager.disconnect(sid, "/")
+        del eio.sockets["eio-sid"]
+    assert main.socket_backlog(sid) == 0
+
+
+def test_stats_require_auth(client, register):
+    assert client.get("/delivery/stats").status_code == 401
+    headers, _ = register("alice")
+    assert client.get("/delivery/stats", headers=headers).json["connections"] == 0
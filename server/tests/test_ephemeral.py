@@ -0,0 +1,122 @@
+"""EphemeralEventHub throttling and batching, driven by a fake clock."""
+
+import pytest
+
+from routes.ephemeral import EphemeralEventHub, client_event_payload
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Emits:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, event, data, to):
+        assert event == "ephemeral_batch"
+        assert data["group_room_number"] == to
+        self.batches.append(data)
+
+    def events(self, group_room_number=None):
+        return [
+            (event["user_id"], event["type"], event["payload"])
+            for batch in self.batches
+            if group_room_number in (None, batch["group_room_number"])
+            for event in batch["events"]
+        ]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def emits():
+    return Emits()
+
+
+@pytest.fixture
+def hub(emits, clock):
+    return EphemeralEventHub(emits, throttle_intervals={"typing": 1.0}, clock=clock)
+
+
+def test_one_batch_per_room_per_tick(hub, emits):
+    for user_id in range(5):
+        hub.publish("Group1", user_id, "typing", {"typing": True})
+    hub.publish("Group2", 9, "typing", {"typing": True})
+
+    assert hub.flush() == 2
+    assert [batch["group_room_number"] for batch in emits.batches] == [
+        "Group1",
+        "Group2",
+    ]
+    assert len(emits.events("Group1")) == 5
+
+    # Nothing new: nothing is emitted.
+    assert hub.flush() == 0
+    assert len(emits.batches) == 2
+
+
+def test_burst_from_one_sender_is_coalesced_to_latest_state(hub, emits):
+    for typing in (True, False, True):
+        hub.publish("Group1", 1, "typing", {"typing": typing})
+    hub.flush()
+
+    assert emits.events() == [(1, "typing", {"typing": True})]
+    assert hub.published == 3
+    assert hub.delivered == 1
+
+
+def test_throttle_window_holds_back_the_last_state(hub, emits, clock):
+    hub.publish("Group1", 1, "typing", {"typing": True})
+    hub.flush()
+
+    clock.now = 0.4
+    hub.publish("Group1", 1, "typing", {"typing": True})
+    clock.now = 0.6
+    hub.publish("Group1", 1, "typing", {"typing": False})
+    hub.flush()
+    # Still inside the 1s window: held, not dropped.
+    assert emits.events() == [(1, "typing", {"typing": True})]
+
+    clock.now = 1.0
+    hub.flush()
+    assert emits.events() == [
+        (1, "typing", {"typing": True}),
+        (1, "typing", {"typing": False}),
+    ]
+
+    clock.now = 5.0
+    hub.flush()
+    assert len(emits.events()) == 2
+
+
+def test_throttle_is_per_sender_and_per_room(hub, emits, clock):
+    hub.publish("Group1", 1, "typing", {"typing": True})
+    hub.flush()
+
+    clock.now = 0.1
+    hub.publish("Group1", 2, "typing", {"typing": True})
+    hub.publish("Group2", 1, "typing", {"typing": True})
+    hub.flush()
+    assert len(emits.events()) == 3
+
+
+def test_unknown_event_types_are_ignored(hub, emits):
+    assert not hub.publish("Group1", 1, "shout", {"text": "hi"})
+    assert not hub.publish(None, 1, "typing", {"typing": True})
+    assert hub.flush() == 0
+
+
+def test_client_event_payload():
+    assert client_event_payload("typing", {"typing": True}) == {"typing": True}
+    assert client_event_payload("typing", {"typing": "yes"}) is None
+    assert client_event_payload("typing", {"typing": True, "extra": 1}) is None
+    assert client_event_payload("typing", ["typing"]) is None
+    assert client_event_payload("presence", {"online": True}) is None
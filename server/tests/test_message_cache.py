@@ -0,0 +1,49 @@
+"""RoomMessageCache change application."""
+
+from routes.message_cache import RoomMessageCache
+
+
+def change(op, id, seq, text=""):
+    return {"op": op, "id": id, "seq": seq, "text": text}
+
+
+def test_apply_is_idempotent_and_ignores_older_changes():
+    cache = RoomMessageCache()
+    cache.load("Group1", 1, [change("create", 1, 1, "hello")])
+
+    edit = change("edit", 1, 2, "hello, edited")
+    cache.apply("Group1", [edit])
+    cache.apply("Group1", [edit])
+    cache.apply("Group1", [change("edit", 1, 1, "stale")])
+
+    assert cache.get("Group1") == (2, [{"id": 1, "seq": 2, "text": "hello, edited"}])
+
+
+def test_apply_only_advances_seq_over_contiguous_changes():
+    cache = RoomMessageCache()
+    cache.load("Group1", 1, [change("create", 1, 1)])
+
+    # seq 2 never arrived, so the room stays at 1 and the next read fetches it.
+    cache.apply("Group1", [change("create", 3, 3)])
+    assert cache.seq("Group1") == 1
+    assert [m["id"] for m in cache.get("Group1")[1]] == [1, 3]
+
+    cache.apply("Group1", [change("create", 2, 2), change("delete", 3, 4)])
+    assert cache.seq("Group1") == 2
+
+    # A database read says how far the changes go.
+    cache.apply("Group1", [change("delete", 3, 4)], seq=4)
+    seq, messages = cache.get("Group1")
+    assert seq == 4
+    assert [m["id"] for m in messages] == [1, 2]
+
+
+def test_apply_to_uncached_room_and_eviction():
+    cache = RoomMessageCache(max_rooms=1)
+    cache.apply("Group1", [change("create", 1, 1)])
+    assert cache.get("Group1") is None
+
+    cache.load("Group1", 0, [])
+    cache.load("Group2", 0, [])
+    assert cache.seq("Group1") is None
+    assert cache.seq("Group2") == 0
@@ -0,0 +1,73 @@
+"""The Alembic chain, run against every database profile."""
+
+import os
+
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import text
+
+BASE = "0f3a61c2b7d4"
+
+
+def migrations_dir(main):
+    return os.path.join(os.path.dirname(main.__file__), "migrations")
+
+
+def rows(main, sql):
+    return [tuple(row) for row in main.db.session.execute(text(sql))]
+
+
+def test_upgrade_existing_data_downgrade_and_upgrade_again(main):
+    directory = migrations_dir(main)
+    with main.app.app_context():
+        main.db.drop_all()
+        main.db.session.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        main.db.session.commit()
+
+        # Rows written before the first real migration, with foreign keys.
+        upgrade(directory=directory, revision=BASE)
+        main.db.session.execute(
+            text(
+                "INSERT INTO userdata (id, name, email, username, password, birthdate) "
+                "VALUES (1, 'alice', 'a@gmail.com', 'alice', 'x', '2000-01-01'), "
+                "(2, 'bobby', 'b@gmail.com', 'bobby', 'x', '2000-01-01')"
+            )
+        )
+        main.db.session.execute(
+            text(
+                "INSERT INTO messages (id, user_id, text, timestamp) VALUES "
+                "(1, 1, 'hello', '2024-05-01 10:00:00'), "
+                "(2, 2, 'hi', '2024-05-01 10:01:00')"
+            )
+        )
+        main.db.session.commit()
+        main.db.session.close()
+
+        upgrade(directory=directory)
+        assert rows(main, "SELECT id, group_room_number, seq FROM messages") == [
+            (1, "default_group", 1),
+            (2, "default_group", 2),
+        ]
+        assert rows(
+            main, "SELECT group_room_number, last_seq, last_message_text FROM rooms"
+        ) == [("default_group", 2, "hi")]
+        assert rows(
+            main,
+            "SELECT user_id, last_read_message_id, unread_count FROM read_states "
+            "ORDER BY user_id",
+        ) == [(1, 2, 0), (2, 2, 0)]
+        main.db.session.close()
+
+        downgrade(directory=directory, revision=BASE)
+        assert rows(main, "SELECT id, text FROM messages") == [
+            (1, "hello"),
+            (2, "hi"),
+        ]
+        main.db.session.close()
+
+        upgrade(directory=directory)
+        assert rows(main, "SELECT COUNT(*) FROM room_members") == [(2,)]
+        main.db.session.close()
+
+        downgrade(directory=directory, revision="base")
+        main.db.session.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        main.db.session.commit()